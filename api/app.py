@@ -1,6 +1,5 @@
 import datetime
 import json
-import requests
 from uuid import uuid4
 
 from celery import chain, group
@@ -8,22 +7,38 @@ from celery.result import AsyncResult
 from flask import Flask, g, jsonify, request
 from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
 import jwt
+import redis
+from twilio.request_validator import RequestValidator
 from werkzeug.security import check_password_hash
 
 from api.celery_app import make_celery
+from api.content_store import ContentMissing
+from api.delayed import DelayedScheduler
 from api.state import State
 from api.tasks import (
     CheckCallProgress,
     DeleteRecordings,
     ExtractInfo,
     InitiateCall,
+    PostCallPipeline,
     PullRecording,
     SendResult,
     TranscribeCall,
+    get_redis,
+    inflight,
+    load_content,
     logger,
+    send_to_callback_urls,
+)
+from api.validate_input import (
+    get_ain_error,
+    get_callback_url_error,
+    user_error_response,
+    validate_ain,
+    validate_callback_url,
 )
-from api.validate_input import validate_ain, validate_callback_url
 from config import Config
+from workflow import http_session
 
 
 #
@@ -51,6 +66,7 @@ extract_info = celery.register_task(ExtractInfo())
 transcribe = celery.register_task(TranscribeCall())
 send_result = celery.register_task(SendResult())
 delete_recordings = celery.register_task(DeleteRecordings())
+post_call_pipeline = celery.register_task(PostCallPipeline())
 
 
 @celery.task()
@@ -85,9 +101,147 @@ def send_error(request, exc, traceback, ain, callback_url):
     else:
         data["error_message"] = ""
 
-    logger.info(f"Sending error data: {data} to {callback_url}")
+    # the requests attached to this chain get the error too
+    callback_urls = [
+        url for url in inflight.finish(ain, task_id) if url != callback_url
+    ]
+
+    logger.info(f"Sending error data: {data} to {[callback_url] + callback_urls}")
 
-    requests.post(callback_url, json=data)
+    http_session.post(callback_url, json=data)
+    send_to_callback_urls(callback_urls, data)
+
+
+#
+# Task routing
+#
+
+# queue of each task when routing is enabled: the network bound stages go to
+# queues served by high concurrency (gevent) workers, the cpu bound ones to
+# prefork workers
+task_queues = {
+    call.name: "calls",
+    check_call_progress.name: "io",
+    get_recording_uri.name: "io",
+    send_result.name: "io",
+    delete_recordings.name: "io",
+    send_error.name: "io",
+    transcribe.name: "transcribe",
+    extract_info.name: "extract",
+    # mostly waiting on the speech to text api, as the transcribe stage
+    post_call_pipeline.name: "transcribe",
+}
+
+# tasks not routed above go to celery's default queue
+default_queue = "celery"
+
+
+def route_tasks():
+    celery.conf.update(
+        CELERY_ROUTES={name: {"queue": queue} for name, queue in task_queues.items()}
+    )
+
+
+if Config.celery_route_tasks:
+    route_tasks()
+
+
+def get_queue_depths():
+    """ Returns the number of messages waiting in each queue of the redis
+    broker, the number of messages taken by workers but not acknowledged yet
+    (which includes the tasks waiting for their countdown), and the number of
+    tasks in the delayed scheduler.
+    """
+    queues = [default_queue] + sorted(set(task_queues.values()))
+
+    pipeline = get_redis().pipeline(transaction=False)
+    for queue in queues:
+        pipeline.llen(queue)
+    # see kombu.transport.redis
+    pipeline.hlen("unacked")
+    pipeline.zcard(DelayedScheduler.key)
+    *depths, unacked, delayed = pipeline.execute()
+
+    return dict(zip(queues, depths)), unacked, delayed
+
+
+def post_call_chain(ain, callback_url, task_id, countdown=None):
+    """
+    The tasks run once a call has ended, starting from the call sid:
+    check_call_done* - get_recording* - transcribe* - extract* - send* - ...
+    ... - delete_recording
+
+    *: after failure, we invoke send_error to inform caller of error
+
+    With Config.celery_fused_pipeline, the stages after check_call_done are run
+    by a single post_call_pipeline task.
+    """
+    check_call_done = check_call_progress.s(outer_task_id=task_id)
+    if Config.celery_delayed_scheduler and countdown:
+        # the task delays itself through the delayed scheduler, see
+        # api.delayed
+        check_call_done = check_call_progress.s(
+            outer_task_id=task_id, delay_secs=countdown
+        )
+        countdown = None
+
+    if Config.celery_fused_pipeline:
+        return chain(
+            check_call_done.set(
+                countdown=countdown, link_error=send_error.s(ain, callback_url)
+            ),
+            post_call_pipeline.s(ain, callback_url, outer_task_id=task_id).set(
+                link_error=send_error.s(ain, callback_url)
+            ),
+        )
+
+    return chain(
+        check_call_done.set(
+            countdown=countdown, link_error=send_error.s(ain, callback_url)
+        ),
+        get_recording_uri.s(outer_task_id=task_id).set(
+            link_error=send_error.s(ain, callback_url)
+        ),
+        transcribe.s(outer_task_id=task_id).set(
+            link_error=send_error.s(ain, callback_url)
+        ),
+        extract_info.s(outer_task_id=task_id).set(
+            link_error=send_error.s(ain, callback_url)
+        ),
+        send_result.s(ain, callback_url, outer_task_id=task_id).set(
+            link_error=send_error.s(ain, callback_url)
+        ),
+        delete_recordings.s(),
+    )
+
+
+def process_chain(ain, callback_url, task_id):
+    """
+    Workflow:
+    place_call* - check_call_done* - get_recording* - ...
+    ... - transcribe* - extract* - send* - delete_recording
+
+
+    *: after failure, we invoke send_error to inform caller of error
+
+    If twilio status callbacks are enabled, the chain after place_call is also
+    started by the /call_status route as soon as the call ends, and the
+    delayed check_call_done here is only a safety net.
+    """
+
+    # TODO
+    # add extra error handlers to ensure recordings deleted if get_recording_uri
+    # or transcribe fail
+
+    return chain(
+        call.s(ain, outer_task_id=task_id, callback_url=callback_url).set(
+            link_error=send_error.s(ain, callback_url)
+        ),
+        # delay the initial check as the call takes time
+        post_call_chain(
+            ain, callback_url, task_id, Config.call_status_poll_countdown_secs
+        ),
+    )
 
 
 #
@@ -155,6 +309,10 @@ def get_token():
     return jsonify({"token": token})
 
 
+# returned when a request couldn't be published to the broker
+queue_error_message = "could not queue the request, try again later"
+
+
 @app.route("/process", methods=["POST", "GET"])
 @token_auth.login_required
 def process():
@@ -188,43 +346,176 @@ def process():
     # state
     task_id = str(uuid4())
 
-    """
-    Workflow:
-    place_call* - check_call_done* - get_recording* - ...
-    ... - transcribe* - extract* - send* - delete_recording
+    # answer repeated requests from the last result if it is recent enough
+    data = inflight.get_result(ain)
+    if data is not None:
+        logger.info(f"Sending stored result for ain {ain}")
+        result = send_result.s(
+            {"data": data}, ain, callback_url, outer_task_id=task_id, fan_out=False
+        ).apply_async(task_id=task_id)
+        return jsonify(
+            {"ain": ain, "task_id": result.task_id, "state": result.state, "data": data}
+        )
 
+    # if the ain is already being processed, attach to that chain instead of
+    # placing another call
+    inflight_task_id = inflight.register(ain, task_id, callback_url)
+    if inflight_task_id != task_id:
+        logger.info(f"Ain {ain} already in flight with task {inflight_task_id}")
+        result = AsyncResult(inflight_task_id)
+        return jsonify({"ain": ain, "task_id": result.task_id, "state": result.state})
 
-    *: after failure, we invoke send_error to inform caller of error
+    try:
+        result = start_process_chain(ain, callback_url, task_id)
+    except Exception:
+        logger.exception(f"Could not queue ain {ain}")
+        response = jsonify(
+            {"ain": ain, "state": State.error, "error_message": queue_error_message}
+        )
+        response.status_code = 503
+        return response
+
+    return jsonify({"ain": ain, "task_id": result.task_id, "state": result.state})
+
+
+def start_process_chain(ain, callback_url, task_id):
+    """ Publishes the chain of a request registered as in flight.
+
+    If that fails the ain is unregistered, so that repeated requests don't
+    attach to a chain that never runs, and the error is raised.
     """
+    try:
+        return process_chain(ain, callback_url, task_id).apply_async(task_id=task_id)
+    except Exception:
+        inflight.finish(ain, task_id)
+        raise
 
-    # TODO
-    # add extra error handlers to ensure recordings deleted if get_recording_uri
-    # or transcribe fail
 
-    result = chain(
-        call.s(ain, outer_task_id=task_id).set(
-            link_error=send_error.s(ain, callback_url)
-        ),
-        check_call_progress.s(outer_task_id=task_id).set(
-            countdown=60,  # delay the initial check as the call takes time
-            link_error=send_error.s(ain, callback_url),
-        ),
-        get_recording_uri.s(outer_task_id=task_id).set(
-            link_error=send_error.s(ain, callback_url)
-        ),
-        transcribe.s(outer_task_id=task_id).set(
-            link_error=send_error.s(ain, callback_url)
-        ),
-        extract_info.s(outer_task_id=task_id).set(
-            link_error=send_error.s(ain, callback_url)
-        ),
-        send_result.s(ain, callback_url, outer_task_id=task_id).set(
-            link_error=send_error.s(ain, callback_url)
-        ),
-        delete_recordings.s(),
-    ).apply_async(task_id=task_id)
+@app.route("/process_batch", methods=["POST"])
+@token_auth.login_required
+def process_batch():
+    """
+    Takes a json array of {"ain": ..., "callback_url": ...} objects, or the
+    same objects one per line (json lines, with an application/x-ndjson
+    content type), and processes each of them as process() does.
 
-    return jsonify({"ain": ain, "task_id": result.task_id, "state": result.state})
+    Returns {"results": [...]} in the same order as the requests, with the ain
+    and task_id of each valid request (and the data if answered from a stored
+    result), or the state and error message of each invalid one.
+    """
+    # check that the current user has enough privileges
+    if not g.current_user["has_access"]:
+        msg = "The current user is not authorized to make this request"
+        response = jsonify({"state": State.user_not_authorized, "error_message": msg})
+        response.status_code = 403
+        return response
+
+    try:
+        batch = read_batch_requests()
+    except ValueError as exc:
+        return user_error_response(str(exc))
+
+    results = [None] * len(batch)
+    # (index, ain, callback_url, task_id) of the valid requests
+    valid_requests = []
+
+    for i, item in enumerate(batch):
+        if not isinstance(item, dict):
+            results[i] = {
+                "state": State.user_error,
+                "error_message": "request must be a json object",
+            }
+            continue
+
+        ain = item.get("ain")
+        callback_url = item.get("callback_url")
+        if ain is not None and not isinstance(ain, str):
+            ain = str(ain)
+
+        msg = get_ain_error(ain) or get_callback_url_error(callback_url)
+        if msg is not None:
+            results[i] = {"ain": ain, "state": State.user_error, "error_message": msg}
+            continue
+
+        # AINs are 8 or 9 digit numbers.
+        # If an 8 digit number is provided, a 0 must be pre-pended
+        if len(ain) == 8:
+            ain = "0" + ain
+
+        valid_requests.append((i, ain, callback_url, str(uuid4())))
+
+    # the stored results and in flight registrations are each fetched in a
+    # single round trip to redis
+    stored_results = inflight.get_results([ain for _, ain, _, _ in valid_requests])
+
+    new_requests = []
+    for (i, ain, callback_url, task_id), data in zip(valid_requests, stored_results):
+        if data is None:
+            new_requests.append((i, ain, callback_url, task_id))
+            continue
+
+        send_result.s(
+            {"data": data}, ain, callback_url, outer_task_id=task_id, fan_out=False
+        ).apply_async(task_id=task_id)
+        results[i] = {"ain": ain, "task_id": task_id, "data": data}
+
+    inflight_task_ids = inflight.register_many(
+        [(ain, task_id, callback_url) for _, ain, callback_url, task_id in new_requests]
+    )
+
+    for (i, ain, callback_url, task_id), inflight_task_id in zip(
+        new_requests, inflight_task_ids
+    ):
+        if inflight_task_id == task_id:
+            try:
+                start_process_chain(ain, callback_url, task_id)
+            except Exception:
+                logger.exception(f"Could not queue ain {ain}")
+                results[i] = {
+                    "ain": ain,
+                    "state": State.error,
+                    "error_message": queue_error_message,
+                }
+                continue
+        results[i] = {"ain": ain, "task_id": inflight_task_id}
+
+    logger.info(
+        f"Batch of {len(batch)} requests: {len(valid_requests)} valid, "
+        f"{len(new_requests)} not answered from a stored result"
+    )
+
+    return jsonify({"results": results})
+
+
+def read_batch_requests():
+    """ Returns the list of requests posted to process_batch.
+
+    Raises ValueError if the body isn't a json array or json lines, or has too
+    many requests.
+    """
+    max_size = Config.process_batch_max_size
+    too_many = f"at most {max_size} requests per batch"
+
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        batch = []
+        # read the body line by line rather than all at once
+        for line in request.stream:
+            if not line.strip():
+                continue
+            if len(batch) == max_size:
+                raise ValueError(too_many)
+            try:
+                batch.append(json.loads(line))
+            except ValueError:
+                raise ValueError("invalid json line")
+        return batch
+
+    batch = request.get_json(force=True, silent=True)
+    if not isinstance(batch, list):
+        raise ValueError("expected a json array of requests")
+    if len(batch) > max_size:
+        raise ValueError(too_many)
+    return batch
 
 
 @app.route("/status/<task_id>")
@@ -235,6 +526,16 @@ def status(task_id):
     # result.info stores either the final result, intermediate metadata, or an exception
     data = result.info
 
+    # failure metadata may reference data in the content store, see SendResult
+    if isinstance(data, dict) and "data_ref" in data:
+        data = dict(data)
+        try:
+            data["data"] = load_content(data, "data")
+        except (ContentMissing, redis.RedisError, OSError):
+            logger.exception(f"Could not load the data of task {task_id}")
+            data["data"] = None
+        del data["data_ref"]
+
     # ensure the data is json serialable (will fail for exceptions)
     try:
         json.dumps(data)
@@ -244,6 +545,71 @@ def status(task_id):
     return jsonify({"task_id": result.task_id, "state": result.state, "data": data})
 
 
+@app.route("/metrics/queues")
+@token_auth.login_required
+def queue_metrics():
+    try:
+        depths, unacked, delayed = get_queue_depths()
+    except redis.RedisError:
+        logger.exception("Could not get queue depths")
+        return "", 503
+
+    return jsonify({"queues": depths, "unacked": unacked, "delayed": delayed})
+
+
+def twilio_auth_tokens():
+    """ Returns the auth token of each account calls are placed from.
+    """
+    auth_tokens = {
+        account_sid: auth_token
+        for account_sid, auth_token, _ in Config.call_twilio_additional_callers
+    }
+    auth_tokens[Config.call_twilio_account_sid] = Config.call_twilio_auth_token
+    return auth_tokens
+
+
+@app.route("/call_status", methods=["POST"])
+def call_status_callback():
+    """
+    Twilio posts here when a call placed with a status callback ends, see:
+    https://www.twilio.com/docs/voice/api/call-resource#statuscallback
+
+    We continue the chain right away instead of waiting for the next poll.
+    """
+    # validate against the url we gave twilio, as the url seen here may differ
+    # behind a proxy
+    url = f"{Config.call_status_callback_url}?{request.query_string.decode()}"
+    signature = request.headers.get("X-Twilio-Signature", "")
+    # twilio signs with the auth token of the account the call was placed from
+    validator = RequestValidator(
+        twilio_auth_tokens().get(
+            request.form.get("AccountSid"), Config.call_twilio_auth_token
+        )
+    )
+    if not validator.validate(url, request.form, signature):
+        return "", 403
+
+    call_sid = request.form.get("CallSid")
+    call_status = request.form.get("CallStatus")
+
+    if call_status in CheckCallProgress.in_progress_call_states:
+        return "", 204
+
+    ain = request.args.get("ain")
+    callback_url = request.args.get("callback_url")
+    task_id = request.args.get("outer_task_id")
+
+    logger.info(f"Call {call_sid} ended with status {call_status}")
+
+    # the chain's last task takes the outer task id so that its result is the
+    # overall result, as in process()
+    post_call_chain(ain, callback_url, task_id).apply_async(
+        args=(call_sid,), task_id=task_id
+    )
+
+    return "", 204
+
+
 @app.route("/debug_callback", methods=["POST"])
 def debug_callback():
     if not request.is_json:
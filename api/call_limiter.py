@@ -0,0 +1,121 @@
+"""
+Limits on the calls placed by all workers, shared through Redis: a token
+bucket for the rate at which calls are placed (twilio limits it), and a cap
+on the number of calls in progress at once (the court's line gets busy).
+
+A call takes one of max_concurrent_calls slots when it is placed, and gives it
+back when CheckCallProgress sees it has ended. Slots also expire after
+slot_ttl_secs, so that a lost release doesn't keep a slot forever.
+
+Redis errors are logged and treated as "no limit", as celery's per worker
+rate limit still applies.
+"""
+
+import redis
+from celery.utils.log import get_task_logger
+
+
+logger = get_task_logger("app")
+
+
+# returns "0" and takes a slot (and a token) for ARGV[5] if a call can be
+# placed now, "-1" if all slots are taken, and otherwise the number of seconds
+# until the next token
+_acquire_script = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_concurrent_calls = tonumber(ARGV[3])
+
+if max_concurrent_calls > 0 then
+    redis.call("ZREMRANGEBYSCORE", KEYS[2], "-inf", now)
+    if not redis.call("ZSCORE", KEYS[2], ARGV[5])
+        and redis.call("ZCARD", KEYS[2]) >= max_concurrent_calls then
+        return "-1"
+    end
+end
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated_at) * rate)
+
+if tokens < 1 then
+    return tostring((1 - tokens) / rate)
+end
+
+redis.call("HSET", KEYS[1], "tokens", tokens - 1, "updated_at", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+if max_concurrent_calls > 0 then
+    redis.call("ZADD", KEYS[2], now + tonumber(ARGV[4]), ARGV[5])
+end
+return "0"
+"""
+
+
+class CallLimiter(object):
+
+    bucket_key = "call_limiter:bucket"
+    slots_key = "call_limiter:slots"
+
+    def __init__(
+        self,
+        get_redis,
+        calls_per_sec=1,
+        burst=1,
+        max_concurrent_calls=0,
+        slot_ttl_secs=900,
+        slot_wait_secs=30,
+    ):
+        """
+        get_redis: returns the redis client to use
+        max_concurrent_calls: 0 for no cap
+        slot_wait_secs: how long to wait before trying again when all slots
+        are taken
+        """
+        self.get_redis = get_redis
+        self.calls_per_sec = calls_per_sec
+        self.burst = burst
+        self.max_concurrent_calls = max_concurrent_calls
+        self.slot_ttl_secs = slot_ttl_secs
+        self.slot_wait_secs = slot_wait_secs
+
+    def acquire(self, slot_id):
+        """ Returns 0 if a call can be placed now, in which case it takes a slot
+        for slot_id, otherwise the number of seconds to wait before trying
+        again.
+
+        Acquiring again for a slot_id which already has a slot only takes a
+        token.
+        """
+        try:
+            wait_secs = float(
+                self.get_redis().eval(
+                    _acquire_script,
+                    2,
+                    self.bucket_key,
+                    self.slots_key,
+                    self.calls_per_sec,
+                    self.burst,
+                    self.max_concurrent_calls,
+                    self.slot_ttl_secs,
+                    slot_id,
+                )
+            )
+        except redis.RedisError:
+            logger.exception("Could not check call limits")
+            return 0
+
+        if wait_secs < 0:
+            return self.slot_wait_secs
+        return wait_secs
+
+    def release(self, slot_id):
+        if not self.max_concurrent_calls:
+            return
+
+        try:
+            self.get_redis().zrem(self.slots_key, slot_id)
+        except redis.RedisError:
+            logger.exception(f"Could not release call slot {slot_id}")
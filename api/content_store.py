@@ -0,0 +1,128 @@
+"""
+Claim check stores for the payloads passed between the stages of a chain
+(transcripts, extracted info): a stage puts its payload in the store and
+passes on a small reference to it, so that the payload isn't serialized into
+the broker and stored in the result backend again at every hop.
+
+Payloads are kept in Redis, or in a local directory (which all the workers
+running the chain's stages must share), and expire after ttl_secs.
+"""
+
+import json
+import os
+import time
+from uuid import uuid4
+
+
+class ContentMissing(Exception):
+    """ The payload for a reference expired or was deleted.
+    """
+
+    pass
+
+
+class RedisContentStore(object):
+
+    prefix = "content"
+
+    def __init__(self, get_redis, ttl_secs=86400):
+        """
+        get_redis: returns the redis client to use
+        """
+        self.get_redis = get_redis
+        self.ttl_secs = ttl_secs
+
+    def _key(self, ref):
+        return f"{self.prefix}:{ref}"
+
+    def put(self, payload):
+        """ Stores the json serializable payload, returns its reference.
+
+        Raises redis.RedisError if it couldn't be stored.
+        """
+        ref = uuid4().hex
+        self.get_redis().set(self._key(ref), json.dumps(payload), ex=self.ttl_secs)
+        return ref
+
+    def get(self, ref):
+        raw = self.get_redis().get(self._key(ref))
+        if raw is None:
+            raise ContentMissing(ref)
+        return json.loads(raw)
+
+    def delete(self, ref):
+        self.get_redis().delete(self._key(ref))
+
+
+class DiskContentStore(object):
+    def __init__(self, directory, ttl_secs=86400, purge_interval_secs=600):
+        """
+        purge_interval_secs: how often put removes the expired payloads of
+        references that were never deleted
+        """
+        self.directory = directory
+        self.ttl_secs = ttl_secs
+        self.purge_interval_secs = purge_interval_secs
+
+        self._last_purge = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, ref):
+        return os.path.join(self.directory, f"{ref}.json")
+
+    def put(self, payload):
+        """ Stores the json serializable payload, returns its reference.
+
+        Raises OSError if it couldn't be stored.
+        """
+        if time.time() - self._last_purge > self.purge_interval_secs:
+            self.purge_expired()
+
+        ref = uuid4().hex
+        path = self._path(ref)
+
+        # write to a temporary file first so that readers never see a partial
+        # payload
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+        return ref
+
+    def get(self, ref):
+        path = self._path(ref)
+        try:
+            if os.path.getmtime(path) < time.time() - self.ttl_secs:
+                self.delete(ref)
+                raise ContentMissing(ref)
+
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ContentMissing(ref)
+
+    def delete(self, ref):
+        try:
+            os.remove(self._path(ref))
+        except FileNotFoundError:
+            pass
+
+    def purge_expired(self):
+        """ Removes the expired payloads, returns how many were removed.
+        """
+        self._last_purge = time.time()
+        expires_before = self._last_purge - self.ttl_secs
+
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < expires_before:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                # removed by another worker meanwhile
+                pass
+
+        return removed
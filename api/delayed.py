@@ -0,0 +1,166 @@
+"""
+Delayed execution of tasks through a Redis sorted set, instead of celery's
+countdowns.
+
+With the Redis broker, a task sent with a countdown is taken by a worker right
+away and held in its memory until due, and is redelivered (so run twice) if it
+isn't acknowledged within the visibility timeout. Here delayed tasks are kept
+in a sorted set scored by their due time, and a poller (in each worker, see
+api.tasks, or run on its own with python -m api.delayed) publishes them to
+their queue once due.
+
+Due tasks are moved atomically to a processing set with a lease, and only
+removed from it once published, so that a poller dying before publishing them
+doesn't lose them: once their lease expires they are due again. Tasks are
+thus published at least once (their task id doesn't change, so running one
+twice is safe), and otherwise once however many pollers run.
+"""
+
+import logging
+import threading
+import time
+
+from celery import current_app
+from celery.utils.log import get_task_logger
+from kombu.utils import json
+import redis
+
+
+logger = get_task_logger("app")
+
+
+# moves back the tasks of KEYS[2] whose lease expired at ARGV[1], then moves
+# at most ARGV[2] tasks due at ARGV[1] from KEYS[1] to KEYS[2], leased until
+# ARGV[3], and returns them
+_claim_due_script = """
+local expired = redis.call("ZRANGEBYSCORE", KEYS[2], "-inf", ARGV[1])
+for _, task in ipairs(expired) do
+    redis.call("ZADD", KEYS[1], ARGV[1], task)
+end
+if #expired > 0 then
+    redis.call("ZREM", KEYS[2], unpack(expired))
+end
+
+local due = redis.call(
+    "ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, ARGV[2]
+)
+if #due > 0 then
+    redis.call("ZREM", KEYS[1], unpack(due))
+    for _, task in ipairs(due) do
+        redis.call("ZADD", KEYS[2], ARGV[3], task)
+    end
+end
+return due
+"""
+
+
+class DelayedScheduler(object):
+
+    key = "delayed_tasks"
+    processing_key = "delayed_tasks:processing"
+
+    def __init__(
+        self,
+        get_redis,
+        app=None,
+        poll_interval_secs=1,
+        batch_size=100,
+        lease_secs=60,
+    ):
+        """
+        get_redis: returns the redis client to use
+        app: the celery app to publish tasks with, defaults to the current app
+        lease_secs: how long a poller has to publish the tasks it took before
+        they are due again
+        """
+        self.get_redis = get_redis
+        self.app = app
+        self.poll_interval_secs = poll_interval_secs
+        self.batch_size = batch_size
+        self.lease_secs = lease_secs
+
+    def schedule(self, signature, countdown):
+        """ Publishes the task of the given signature in countdown seconds.
+
+        Raises redis.RedisError if it couldn't be scheduled.
+        """
+        self.get_redis().zadd(
+            self.key, {json.dumps(dict(signature)): time.time() + countdown}
+        )
+
+    def release_due(self):
+        """ Publishes the tasks that are due, returns how many were published.
+        """
+        released = 0
+        while True:
+            now = time.time()
+            due = self.get_redis().eval(
+                _claim_due_script,
+                2,
+                self.key,
+                self.processing_key,
+                now,
+                self.batch_size,
+                now + self.lease_secs,
+            )
+
+            app = self.app or current_app
+            for i, data in enumerate(due):
+                try:
+                    app.signature(json.loads(data)).apply_async()
+                except Exception:
+                    # put back the tasks not published, and try again on the
+                    # next poll (if this fails too, their lease expires)
+                    logger.exception("Could not publish delayed task")
+                    pipeline = self.get_redis().pipeline()
+                    pipeline.zadd(self.key, {d: now for d in due[i:]})
+                    pipeline.zrem(self.processing_key, *due[i:])
+                    pipeline.execute()
+                    return released
+
+                self.get_redis().zrem(self.processing_key, data)
+                released += 1
+
+            if len(due) < self.batch_size:
+                return released
+
+    def run(self, stop_event=None):
+        """ Releases due tasks every poll_interval_secs, until stop_event is set.
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                self.release_due()
+            except redis.RedisError:
+                logger.exception("Could not release delayed tasks")
+            stop_event.wait(self.poll_interval_secs)
+
+    def start(self):
+        """ Runs the poller in a daemon thread, returns the event to stop it.
+        """
+        stop_event = threading.Event()
+        thread = threading.Thread(
+            target=self.run, args=(stop_event,), name="delayed-scheduler"
+        )
+        thread.daemon = True
+        thread.start()
+        return stop_event
+
+    def pending_count(self):
+        pipeline = self.get_redis().pipeline(transaction=False)
+        pipeline.zcard(self.key)
+        pipeline.zcard(self.processing_key)
+        return sum(pipeline.execute())
+
+
+def main():
+    # the app has to be set up for the tasks to be published with it
+    from api.app import celery  # noqa: F401
+    from api.tasks import delayed_scheduler
+
+    logging.basicConfig(level=logging.INFO)
+    delayed_scheduler.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Registry of the AINs being processed, shared by the api and the workers
+through Redis, so that repeated requests for an AIN don't each place a call.
+
+A request for an AIN that is already in flight is attached to the existing
+chain: its callback url is added to the ones the result is sent to, and it
+gets the existing task id back. Optionally, the last result for each AIN is
+kept for a freshness window, and requests within it are answered from it.
+
+Redis errors are logged and treated as "not in flight" / "no stored result",
+as it is better to place a duplicate call than to drop a request.
+"""
+
+import json
+
+import redis
+from celery.utils.log import get_task_logger
+
+
+logger = get_task_logger("app")
+
+
+# returns the task id the ain is in flight with, registering task_id if there
+# is none yet, and adds the callback url to the ones to send the result to
+_register_script = """
+local task_id = redis.call("GET", KEYS[1])
+if not task_id then
+    task_id = ARGV[1]
+    redis.call("SET", KEYS[1], task_id, "EX", ARGV[2])
+    redis.call("DEL", KEYS[2])
+end
+redis.call("SADD", KEYS[2], ARGV[3])
+redis.call("EXPIRE", KEYS[2], ARGV[2])
+return task_id
+"""
+
+# if the ain is in flight with task_id, unregisters it and returns the
+# callback urls to send the result to
+_finish_script = """
+if redis.call("GET", KEYS[1]) ~= ARGV[1] then
+    return {}
+end
+local callback_urls = redis.call("SMEMBERS", KEYS[2])
+redis.call("DEL", KEYS[1], KEYS[2])
+return callback_urls
+"""
+
+
+class InflightRegistry(object):
+    def __init__(self, get_redis, ttl_secs=3600, result_freshness_secs=0):
+        """
+        get_redis: returns the redis client to use
+        ttl_secs: an ain is considered in flight for at most this long, in
+        case its chain died without finishing
+        result_freshness_secs: how long results are kept to answer repeated
+        requests from, 0 to disable
+        """
+        self.get_redis = get_redis
+        self.ttl_secs = ttl_secs
+        self.result_freshness_secs = result_freshness_secs
+
+    @staticmethod
+    def _inflight_key(ain):
+        return f"inflight:{ain}"
+
+    @staticmethod
+    def _callbacks_key(ain):
+        return f"inflight:{ain}:callbacks"
+
+    @staticmethod
+    def _result_key(ain):
+        return f"result:{ain}"
+
+    def register(self, ain, task_id, callback_url):
+        """ Returns the task id of the chain the request should be attached to:
+        task_id if the ain wasn't in flight (and the caller should start the
+        chain), the existing chain's task id otherwise.
+        """
+        return self.register_many([(ain, task_id, callback_url)])[0]
+
+    def register_many(self, requests):
+        """ Same as register, for a list of (ain, task_id, callback_url), in a
+        single round trip to Redis.
+        """
+        try:
+            pipeline = self.get_redis().pipeline(transaction=False)
+            for ain, task_id, callback_url in requests:
+                pipeline.eval(
+                    _register_script,
+                    2,
+                    self._inflight_key(ain),
+                    self._callbacks_key(ain),
+                    task_id,
+                    self.ttl_secs,
+                    callback_url,
+                )
+            task_ids = pipeline.execute()
+        except redis.RedisError:
+            logger.exception("Could not register ains as in flight")
+            return [task_id for _, task_id, _ in requests]
+
+        return [task_id.decode("utf8") for task_id in task_ids]
+
+    def finish(self, ain, task_id):
+        """ Unregisters the ain if it is in flight with task_id, and returns the
+        callback urls of all the requests attached to it.
+        """
+        try:
+            callback_urls = self.get_redis().eval(
+                _finish_script,
+                2,
+                self._inflight_key(ain),
+                self._callbacks_key(ain),
+                task_id,
+            )
+        except redis.RedisError:
+            logger.exception(f"Could not unregister in flight ain {ain}")
+            return []
+
+        return sorted(url.decode("utf8") for url in callback_urls)
+
+    def store_result(self, ain, data):
+        if not self.result_freshness_secs:
+            return
+
+        try:
+            self.get_redis().set(
+                self._result_key(ain), json.dumps(data), ex=self.result_freshness_secs
+            )
+        except redis.RedisError:
+            logger.exception(f"Could not store result for ain {ain}")
+
+    def get_result(self, ain):
+        """ Returns the result stored for ain within the freshness window, or
+        None.
+        """
+        return self.get_results([ain])[0]
+
+    def get_results(self, ains):
+        """ Same as get_result, for a list of ains, in a single round trip to
+        Redis.
+        """
+        if not self.result_freshness_secs or not ains:
+            return [None] * len(ains)
+
+        try:
+            results = self.get_redis().mget([self._result_key(ain) for ain in ains])
+        except redis.RedisError:
+            logger.exception("Could not get stored results")
+            return [None] * len(ains)
+
+        return [json.loads(data) if data is not None else None for data in results]
@@ -1,23 +1,41 @@
+import functools
 import random
-import requests
+import time
+
+import redis
 from requests.exceptions import RequestException
 
 from celery import Task
-from celery.exceptions import MaxRetriesExceededError
+from celery.exceptions import Ignore, MaxRetriesExceededError, Retry
+from celery.signals import worker_init, worker_process_init, worker_ready
 from celery.utils.log import get_task_logger
 from twilio.rest.api.v2010.account.call import CallInstance
 
+from api.call_limiter import CallLimiter
+from api.content_store import DiskContentStore, RedisContentStore
+from api.delayed import DelayedScheduler
+from api.inflight import InflightRegistry
 from api.state import State
 from config import Config
 from workflow.call import exceptions as CallExceptions
+from workflow.cache import ResultCache, hash_key
+from workflow import http_session
 from workflow.call.twilio_call_wrapper import TwilioCallWrapper
 from workflow.extract import date_info, location_info
+from workflow.extract.utils import normalize_transcript
 from workflow.transcribe import exceptions as TranscribeExceptions
 from workflow.transcribe.google_transcribe import GoogleTranscriber
+from workflow.transcribe.hedged_transcribe import HedgedTranscriber
 
 
 logger = get_task_logger("app")
 
+http_session.configure(
+    pool_size=Config.http_pool_size,
+    timeout_secs=Config.http_timeout_secs,
+    max_retries=Config.http_max_retries,
+)
+
 twilio = TwilioCallWrapper(
     Config.call_twilio_account_sid,
     Config.call_twilio_auth_token,
@@ -25,13 +43,198 @@ twilio = TwilioCallWrapper(
     Config.call_final_pause_secs,
     Config.call_number_to_call,
     Config.call_twilio_local_number,
+    Config.call_status_callback_url,
+    additional_callers=Config.call_twilio_additional_callers,
+    caller_selection=Config.call_twilio_caller_selection,
+    redis_url=Config.celery_result_backend,
 )
 
 TwilioCallStatus = CallInstance.Status
 
-transcriber = GoogleTranscriber(
-    Config.google_credentials_json, None
-)  # preferred phrases None for now
+transcript_cache = ResultCache(
+    "transcript",
+    max_size=Config.transcript_cache_size,
+    ttl_secs=Config.transcript_cache_ttl_secs,
+    redis_url=(
+        Config.celery_result_backend if Config.transcript_cache_use_redis else None
+    ),
+)
+
+
+def create_transcriber(provider):
+    if provider == "azure":
+        # the azure speech sdk is only needed when azure is used
+        from workflow.transcribe.azure_transcribe import AzureTranscriber
+
+        return AzureTranscriber(Config.azure_speech_key)
+
+    return GoogleTranscriber(
+        Config.google_credentials_json,
+        None,  # preferred phrases None for now
+        use_speech_client=Config.google_use_speech_client,
+        transcript_cache=transcript_cache,
+    )
+
+
+transcriber = create_transcriber(Config.speech_to_text_provider)
+if Config.speech_to_text_hedge_provider:
+    transcriber = HedgedTranscriber(
+        [
+            (Config.speech_to_text_provider, transcriber),
+            (
+                Config.speech_to_text_hedge_provider,
+                create_transcriber(Config.speech_to_text_hedge_provider.lower()),
+            ),
+        ],
+        Config.speech_to_text_hedge_delay_secs,
+    )
+
+extraction_cache = ResultCache(
+    "extract",
+    max_size=Config.extraction_cache_size,
+    ttl_secs=Config.extraction_cache_ttl_secs,
+    redis_url=(
+        Config.celery_result_backend if Config.extraction_cache_use_redis else None
+    ),
+)
+
+
+@worker_init.connect
+def preload_zipcode_index(**kwargs):
+    # load the zipcode index in the main worker process so that the pool
+    # processes forked from it share it
+    location_info.get_zipcode_index(Config.zipcode_index_snapshot_path)
+
+
+@worker_process_init.connect
+def warm_up_transcriber(**kwargs):
+    # each pool process sets up its own speech client
+    try:
+        transcriber.warm_up()
+    except Exception:
+        logger.exception("Failed to warm up transcriber")
+
+
+@functools.lru_cache(maxsize=None)
+def get_redis():
+    """ Returns a client for the redis broker, shared within the process.
+    """
+    return redis.Redis.from_url(Config.celery_broker)
+
+
+inflight = InflightRegistry(
+    get_redis,
+    ttl_secs=Config.process_inflight_ttl_secs,
+    result_freshness_secs=Config.process_result_freshness_secs,
+)
+
+
+def create_content_store(kind):
+    if kind == "redis":
+        return RedisContentStore(get_redis, ttl_secs=Config.content_store_ttl_secs)
+
+    if kind == "disk":
+        return DiskContentStore(
+            Config.content_store_directory, ttl_secs=Config.content_store_ttl_secs
+        )
+
+    return None
+
+
+content_store = create_content_store(Config.content_store)
+
+
+def store_content(request, key):
+    """ Returns request with request[key] moved to the content store, as a
+    reference under "<key>_ref", if the content store is enabled.
+
+    The payload is left in request if it couldn't be stored.
+    """
+    if content_store is None or key not in request:
+        return request
+
+    request = dict(request)
+    try:
+        request[f"{key}_ref"] = content_store.put(request[key])
+    except (redis.RedisError, OSError):
+        logger.exception(f"Could not store {key}, passing it on instead")
+        return request
+
+    del request[key]
+    return request
+
+
+def load_content(request, key):
+    """ Returns request[key], from the content store if request has a reference
+    to it.
+    """
+    ref = request.get(f"{key}_ref")
+    if ref is None:
+        return request.get(key)
+
+    return content_store.get(ref)
+
+
+def delete_content(request, key):
+    ref = request.get(f"{key}_ref")
+    if ref is None:
+        return
+
+    try:
+        content_store.delete(ref)
+    except (redis.RedisError, OSError):
+        # it expires anyway
+        logger.exception(f"Could not delete {key} {ref}")
+
+
+call_limiter = CallLimiter(
+    get_redis,
+    calls_per_sec=Config.call_rate_limit_per_sec,
+    burst=Config.call_rate_limit_burst,
+    max_concurrent_calls=Config.call_max_concurrent,
+    slot_ttl_secs=Config.call_slot_ttl_secs,
+    slot_wait_secs=Config.call_slot_wait_secs,
+)
+
+delayed_scheduler = DelayedScheduler(
+    get_redis, poll_interval_secs=Config.celery_delayed_poll_secs
+)
+
+
+@worker_ready.connect
+def start_delayed_scheduler(**kwargs):
+    # every worker polls for due tasks, each is taken by a single poller
+    if Config.celery_delayed_scheduler:
+        delayed_scheduler.start()
+
+
+def send_to_callback_urls(callback_urls, data):
+    """ Posts data to each of the callback urls, logging failures.
+
+    Used to fan results out to the requests attached to a chain, which don't
+    get retries of their own.
+    """
+    for callback_url in callback_urls:
+        try:
+            http_session.post(callback_url, json=data)
+        except RequestException:
+            logger.exception(f"Failed to send data to {callback_url}")
+
+
+def claim_call_end(call_sid):
+    """ Returns True the first time it is called for a given call sid.
+
+    The end of a call is reported both by twilio's status callback and by
+    polling (as a safety net), only the first to claim it continues the chain.
+    """
+    try:
+        return bool(
+            get_redis().set(f"call_end:{call_sid}", 1, nx=True, ex=24 * 60 * 60)
+        )
+    except redis.RedisError:
+        # better to risk handling the call twice than to not handle it
+        logger.exception(f"Could not claim end of call {call_sid}")
+        return True
 
 
 def get_countdown(retry_backoff, current_retries, retry_jitter, retry_backoff_max):
@@ -50,14 +253,103 @@ def get_countdown(retry_backoff, current_retries, retry_jitter, retry_backoff_ma
     return result
 
 
-class InitiateCall(Task):
+class DelayedTask(Task):
+    """
+    Task whose retries (and deferrals, see defer) of at least
+    Config.celery_delayed_min_countdown_secs go through the delayed scheduler
+    when it is enabled, rather than being held by a worker until due.
+    """
+
+    def use_delayed_scheduler(self, countdown):
+        return (
+            Config.celery_delayed_scheduler
+            and countdown is not None
+            and countdown >= Config.celery_delayed_min_countdown_secs
+            and not self.request.called_directly
+            and not self.request.is_eager
+        )
+
+    def retry(
+        self,
+        args=None,
+        kwargs=None,
+        exc=None,
+        throw=True,
+        eta=None,
+        countdown=None,
+        max_retries=None,
+        **options,
+    ):
+        if eta is not None or not self.use_delayed_scheduler(countdown):
+            return super().retry(
+                args, kwargs, exc, throw, eta, countdown, max_retries, **options
+            )
+
+        # as in Task.retry, apart from how the retry is sent
+        request = self.request
+        retries = request.retries + 1
+        if max_retries is not None:
+            self.override_max_retries = max_retries
+        max_retries = self.max_retries if max_retries is None else max_retries
+
+        if max_retries is not None and retries > max_retries:
+            if exc:
+                raise exc
+            raise self.MaxRetriesExceededError(
+                f"Can't retry {self.name}[{request.id}]"
+            )
+
+        signature = self.signature_from_request(
+            request, args, kwargs, retries=retries, **options
+        )
+        try:
+            delayed_scheduler.schedule(signature, countdown)
+        except redis.RedisError:
+            logger.exception("Could not schedule retry, using a countdown instead")
+            return super().retry(
+                args, kwargs, exc, throw, eta, countdown, max_retries, **options
+            )
+
+        ret = Retry(exc=exc, when=countdown, sig=signature)
+        if throw:
+            raise ret
+        return ret
+
+    def defer(self, countdown, **kwargs):
+        """ Runs the task again in countdown seconds, with the given kwargs
+        updated, without counting it as a retry.
+
+        Raises Ignore to end the current run.
+        """
+        signature = self.signature_from_request(
+            kwargs={**self.request.kwargs, **kwargs}
+        )
+
+        if self.use_delayed_scheduler(countdown):
+            try:
+                delayed_scheduler.schedule(signature, countdown)
+                raise Ignore()
+            except redis.RedisError:
+                logger.exception("Could not schedule task, using a countdown instead")
+
+        signature.apply_async(countdown=countdown)
+        raise Ignore()
+
+
+class InitiateCall(DelayedTask):
     """
         Schedules a call and returns the call sid.
         This task is rate limited to 1 request per second because of twilio limitations.
+        The rate and number of calls in progress are also limited across all
+        workers, see api.call_limiter.
     """
 
     rate_limit = "1/s"
 
+    # waits for the call limiter shorter than this are spent sleeping, longer
+    # ones by retrying the task later
+    max_limiter_sleep_secs = 5
+
     max_retries = 10
     retry_backoff = 30
     retry_jitter = True
@@ -67,19 +359,44 @@ class InitiateCall(Task):
 
     default_error_message = "Error placing call"
 
-    def run(self, ain, *, outer_task_id):
+    def wait_for_call_limiter(self, outer_task_id):
+        while True:
+            wait_secs = call_limiter.acquire(outer_task_id)
+            if not wait_secs:
+                return
+
+            if wait_secs > self.max_limiter_sleep_secs:
+                logger.info(f"Call limit reached, retrying in {wait_secs}s")
+                # waiting for the limiter isn't a failure, so the task is run
+                # again without counting it as a retry
+                self.defer(wait_secs)
+
+            time.sleep(wait_secs)
+
+    def run(self, ain, *, outer_task_id, callback_url=None):
+        self.wait_for_call_limiter(outer_task_id)
+
         try:
             logger.info(f"Call task got ain = {ain}")
 
             self.update_state(task_id=outer_task_id, state=State.calling)
 
-            call_sid = twilio.place_and_record_call(ain)
+            # passed back to us by twilio's status callback when the call ends
+            status_callback_params = {
+                "ain": ain,
+                "callback_url": callback_url,
+                "outer_task_id": outer_task_id,
+            }
+            call_sid = twilio.place_and_record_call(ain, status_callback_params)
 
             logger.info(f"Call scheduled, call_sid = {call_sid}")
+            logger.info(f"Recent calls per number = {twilio.caller_stats()}")
 
             return call_sid
 
         except RequestException:
+            call_limiter.release(outer_task_id)
+
             # we retry on request exceptions up to max retries
             try:
                 countdown = get_countdown(
@@ -99,6 +416,8 @@ class InitiateCall(Task):
                 raise
 
         except Exception:
+            call_limiter.release(outer_task_id)
+
             self.update_state(
                 task_id=outer_task_id,
                 state=State.calling_error,
@@ -107,7 +426,7 @@ class InitiateCall(Task):
             raise
 
 
-class CheckCallProgress(Task):
+class CheckCallProgress(DelayedTask):
     """ Retrieves the recording uri from a call sid once the call has completed.
     """
 
@@ -133,7 +452,14 @@ class CheckCallProgress(Task):
         TwilioCallStatus.IN_PROGRESS,
     ]
 
-    def run(self, call_sid, *, outer_task_id):
+    def run(self, call_sid, *, outer_task_id, delay_secs=None):
+        """
+        delay_secs: if set, the first check is delayed by this long, through
+        the delayed scheduler (see post_call_chain in api.app)
+        """
+        if delay_secs:
+            self.defer(delay_secs, delay_secs=None)
+
         try:
             status = twilio.fetch_status(call_sid)
             logger.info(f'Status of call {call_sid} is "{status}"')
@@ -141,6 +467,14 @@ class CheckCallProgress(Task):
             if status in self.in_progress_call_states:
                 raise CallExceptions.CallInProgress
 
+            # the call has ended, so it no longer counts towards the limit
+            call_limiter.release(outer_task_id)
+
+            if not claim_call_end(call_sid):
+                # already handled after twilio's status callback (or by polling)
+                logger.info(f"End of call {call_sid} already handled")
+                raise Ignore()
+
             if status in self.failed_call_states:
                 logger.error(f'Failed call status: "{status}"')
                 raise CallExceptions.CallFailed
@@ -154,6 +488,9 @@ class CheckCallProgress(Task):
             self.update_state(task_id=outer_task_id, state=State.call_complete)
             return call_sid
 
+        except Ignore:
+            raise
+
         except (CallExceptions.CallInProgress, RequestException):
             # we retry if call in progress, or on request exceptions up to max retries
             try:
@@ -182,7 +519,105 @@ class CheckCallProgress(Task):
             raise
 
 
-class PullRecording(Task):
+#
+# Stages after the call, run by their own task or all by PostCallPipeline.
+# task is the one running the stage, for the state updates on outer_task_id.
+#
+
+
+def pull_recording(task, call_sid, outer_task_id):
+    # call has completed, find the recording uri
+    recordings = twilio.fetch_recordings(call_sid)
+
+    if not recordings or len(recordings) == 0:
+        logger.error(f"Call {call_sid} completed with no recording")
+
+        raise CallExceptions.NoRecording
+
+    recording_uri = twilio.get_full_recording_uri(recordings[0])
+
+    logger.info(f"Got recording_uri = {recording_uri}")
+
+    task.update_state(task_id=outer_task_id, state=State.recording_ready)
+
+    return {"call_sid": call_sid, "recording_uri": recording_uri}
+
+
+def transcribe_recording(task, request, outer_task_id):
+    call_sid = request.get("call_sid")
+    recording_uri = request.get("recording_uri")
+
+    task.update_state(task_id=outer_task_id, state=State.transcribing)
+
+    text = transcriber.transcribe_audio_at_uri(recording_uri)
+
+    logger.info(f"Transcript = {text}")
+    if isinstance(transcriber, HedgedTranscriber):
+        logger.info(f"Transcriber latencies = {transcriber.latency_stats()}")
+    logger.info(f"Transcript cache stats = {transcript_cache.stats()}")
+
+    task.update_state(task_id=outer_task_id, state=State.transcribing_done)
+
+    return {"call_sid": call_sid, "text": text}
+
+
+def extract_call_info(task, request, outer_task_id):
+    """
+    returns dictionary with transcription text and keys relating to extracted date
+    and location info.
+    all key values (except transcription text) are None if extraction fails
+    """
+
+    text = request.get("text")
+    call_sid = request.get("call_sid")
+
+    logger.info(f"Extract got text = {text}.")
+    task.update_state(task_id=outer_task_id, state=State.extracting)
+
+    d = {"trancription": text}
+
+    # the same message is often transcribed identically for many ains, so
+    # we cache the extracted info by transcript (up to whitespace)
+    key = hash_key(normalize_transcript(text))
+
+    date = extraction_cache.get_or_compute(
+        f"date:{key}", lambda: date_info.extract_date_time(text)
+    )
+    d.update(date)
+
+    location = extraction_cache.get_or_compute(
+        f"location:{key}", lambda: location_info.extract_location(text)
+    )
+    d.update(location)
+
+    logger.info(f"Date = {date}. Location = {location}")
+    logger.info(f"Extraction cache stats = {extraction_cache.stats()}")
+    task.update_state(task_id=outer_task_id, state=State.extracting_done)
+
+    return {"call_sid": call_sid, "data": d}
+
+
+def send_call_result(task, request, ain, callback_url, outer_task_id, fan_out):
+    data = request.get("data")
+
+    logger.info(
+        f"Send task got ain = {ain}, callback_url = {callback_url}, data = {data}."
+    )
+    http_session.post(callback_url, json=data)
+
+    if fan_out:
+        inflight.store_result(ain, data)
+        callback_urls = inflight.finish(ain, outer_task_id)
+        send_to_callback_urls(
+            [url for url in callback_urls if url != callback_url], data
+        )
+
+    task.update_state(task_id=outer_task_id, state=State.sending_to_callback_done)
+
+    return request
+
+
+class PullRecording(DelayedTask):
 
     max_retries = 10
     retry_backoff = 30
@@ -194,22 +629,8 @@ class PullRecording(Task):
     default_error_message = "Error retrieving call recording"
 
     def run(self, call_sid, *, outer_task_id):
-        # call has completed, find the recording uri
         try:
-            recordings = twilio.fetch_recordings(call_sid)
-
-            if not recordings or len(recordings) == 0:
-                logger.error(f"Call {call_sid} completed with no recording")
-
-                raise CallExceptions.NoRecording
-
-            recording_uri = twilio.get_full_recording_uri(recordings[0])
-
-            logger.info(f"Got recording_uri = {recording_uri}")
-
-            self.update_state(task_id=outer_task_id, state=State.recording_ready)
-
-            return {"call_sid": call_sid, "recording_uri": recording_uri}
+            return pull_recording(self, call_sid, outer_task_id)
 
         except RequestException:
             # we retry on request exceptions up to max retries
@@ -253,17 +674,18 @@ class DeleteRecordings(Task):
         # the given data as the overall result for the chain.
 
         call_sid = request.get("call_sid")
-        data = request.get("data")
 
         try:
-            logger.info(f"Delete recordings task got call_sid = {call_sid}.")
-
-            call = twilio.fetch_call(call_sid)
+            data = load_content(request, "data")
+        except Exception:
+            # the result was sent already, the chain just won't have it
+            logger.exception(f"Could not load the result for call {call_sid}")
+            data = None
 
-            for recording in call.recordings.list():
-                recording.delete()
+        try:
+            logger.info(f"Delete recordings task got call_sid = {call_sid}.")
 
-            return data
+            twilio.delete_recordings(call_sid)
 
         # We retry on request exceptions up to max retries, and for other exceptions
         # we don't re-raise
@@ -279,21 +701,21 @@ class DeleteRecordings(Task):
 
             except MaxRetriesExceededError:
                 logger.error(f"Failed to delete recordings for call {call_sid}")
-                return data
 
         except Exception:
             logger.error(f"Failed to delete recordings for call {call_sid}")
-            return data
 
+        delete_content(request, "text")
+        delete_content(request, "data")
+        return data
 
-class TranscribeCall(Task):
+
+class TranscribeCall(DelayedTask):
     """ Returns a transcription of the audio at the given uri.
     """
 
-    # TODO
-    # Ensure we only send < 1 min of audio to be transcribed -- otherwise we
-    # need to make an async call to the speech to text service
-    # (and not use speech rec package).
+    # Note: recordings longer than a minute are split by the transcriber, as the
+    # synchronous speech to text api only accepts up to a minute of audio.
 
     track_started = True
     retry_backoff = 4
@@ -304,18 +726,9 @@ class TranscribeCall(Task):
 
     def run(self, request, *, outer_task_id):
         try:
-            call_sid = request.get("call_sid")
-            recording_uri = request.get("recording_uri")
-
-            self.update_state(task_id=outer_task_id, state=State.transcribing)
-
-            text = transcriber.transcribe_audio_at_uri(recording_uri)
-
-            logger.info(f"Transcript = {text}")
-
-            self.update_state(task_id=outer_task_id, state=State.transcribing_done)
-
-            return {"call_sid": call_sid, "text": text}
+            return store_content(
+                transcribe_recording(self, request, outer_task_id), "text"
+            )
 
         except TranscribeExceptions.RequestError:
             # we retry on request errors
@@ -344,33 +757,22 @@ class ExtractInfo(Task):
     track_started = True
 
     def run(self, request, *, outer_task_id):
-        """
-        returns dictionary with transcription text and keys relating to extracted date
-        and location info.
-        all key values (except transcription text) are None if extraction fails
-        """
+        result = store_content(
+            extract_call_info(
+                self, {**request, "text": load_content(request, "text")}, outer_task_id
+            ),
+            "data",
+        )
 
-        text = request.get("text")
-        call_sid = request.get("call_sid")
-
-        logger.info(f"Extract got text = {text}.")
-        self.update_state(task_id=outer_task_id, state=State.extracting)
-
-        d = {"trancription": text}
-
-        date = date_info.extract_date_time(text)
-        d.update(date)
+        # the transcript is deleted with the result once the chain is done, as
+        # this task may run again
+        if "text_ref" in request:
+            result["text_ref"] = request["text_ref"]
 
-        location = location_info.extract_location(text)
-        d.update(location)
+        return result
 
-        logger.info(f"Date = {date}. Location = {location}")
-        self.update_state(task_id=outer_task_id, state=State.extracting_done)
 
-        return {"call_sid": call_sid, "data": d}
-
-
-class SendResult(Task):
+class SendResult(DelayedTask):
 
     max_retries = 10
     retry_backoff = 30
@@ -381,20 +783,43 @@ class SendResult(Task):
 
     track_started = True
 
-    def run(self, request, ain, callback_url, *, outer_task_id):
-        try:
-            data = request.get("data")
+    def error_meta(self, request, data):
+        """ The data is referenced rather than copied if it is in the content
+        store, see status in api.app.
+        """
+        if "data_ref" in request:
+            return {
+                "error_message": self.default_error_message,
+                "data_ref": request["data_ref"],
+            }
 
-            logger.info(
-                f"Send task got ain = {ain}, callback_url = {callback_url}, "
-                f"data = {data}."
-            )
-            requests.post(callback_url, json=data)
+        return {"error_message": self.default_error_message, "data": data}
 
-            self.update_state(
-                task_id=outer_task_id, state=State.sending_to_callback_done
+    def run(self, request, ain, callback_url, *, outer_task_id, fan_out=True):
+        """
+        fan_out: if True, the result is also sent to the requests attached to
+        this chain (see api.inflight), and stored for repeated requests.
+        If False (when answering from a stored result), the task is the last
+        of the request and returns the bare data, as DeleteRecordings does at
+        the end of a chain.
+        """
+        data = request.get("data")
+
+        try:
+            data = load_content(request, "data")
+            send_call_result(
+                self,
+                {**request, "data": data},
+                ain,
+                callback_url,
+                outer_task_id,
+                fan_out,
             )
 
+            if not fan_out:
+                return data
+
+            # the reference is passed on, if any
             return request
 
         except RequestException:
@@ -412,7 +837,7 @@ class SendResult(Task):
                 self.update_state(
                     task_id=outer_task_id,
                     state=State.sending_to_callback_error,
-                    meta={"error_message": self.default_error_message, "data": data},
+                    meta=self.error_meta(request, data),
                 )
                 raise
 
@@ -420,6 +845,101 @@ class SendResult(Task):
             self.update_state(
                 task_id=outer_task_id,
                 state=State.sending_to_callback_error,
-                meta={"error_message": self.default_error_message, "data": data},
+                meta=self.error_meta(request, data),
+            )
+            raise
+
+
+class PostCallPipeline(DelayedTask):
+    """ Runs the stages after the call (get_recording_uri to delete_recordings)
+    in a single task, saving the broker round trips between them.
+
+    The states set on outer_task_id are the same as with a task per stage, and
+    each stage is retried as its task would be, but in place: the worker
+    sleeps through the backoff instead of sending a retry.
+    """
+
+    track_started = True
+
+    def run(self, request, ain, callback_url, *, outer_task_id):
+        call_sid = request.get("call_sid")
+
+        try:
+            request = self.run_stage(
+                PullRecording,
+                RequestException,
+                lambda: pull_recording(self, call_sid, outer_task_id),
+            )
+        except Exception:
+            self.update_state(
+                task_id=outer_task_id,
+                state=State.recording_retrieval_error,
+                meta={"error_message": PullRecording.default_error_message},
+            )
+            raise
+
+        try:
+            request = self.run_stage(
+                TranscribeCall,
+                TranscribeExceptions.RequestError,
+                lambda: transcribe_recording(self, request, outer_task_id),
+            )
+        except Exception:
+            self.update_state(task_id=outer_task_id, state=State.transcribing_failed)
+            raise
+
+        request = extract_call_info(self, request, outer_task_id)
+
+        try:
+            request = self.run_stage(
+                SendResult,
+                RequestException,
+                lambda: send_call_result(
+                    self, request, ain, callback_url, outer_task_id, True
+                ),
+            )
+        except Exception:
+            self.update_state(
+                task_id=outer_task_id,
+                state=State.sending_to_callback_error,
+                meta={
+                    "error_message": SendResult.default_error_message,
+                    "data": request.get("data"),
+                },
             )
             raise
+
+        try:
+            self.run_stage(
+                DeleteRecordings,
+                RequestException,
+                lambda: twilio.delete_recordings(call_sid),
+            )
+        except Exception:
+            logger.error(f"Failed to delete recordings for call {call_sid}")
+
+        return request.get("data")
+
+    def run_stage(self, stage, retry_on, run):
+        """ Returns run(), retrying it on retry_on exceptions with the backoff
+        and max retries of the stage's task class.
+        """
+        retries = 0
+        while True:
+            try:
+                return run()
+            except retry_on:
+                if retries >= stage.max_retries:
+                    raise
+
+                countdown = get_countdown(
+                    stage.retry_backoff,
+                    retries,
+                    stage.retry_jitter,
+                    stage.retry_backoff_max,
+                )
+                logger.warning(
+                    f"{stage.__name__} failed, retrying in {countdown} seconds"
+                )
+                time.sleep(countdown)
+                retries += 1
@@ -5,45 +5,58 @@ from flask import jsonify
 from api.state import State
 
 
-def validate_ain(ain):
+def get_ain_error(ain):
+    """ Returns the error message for an invalid ain, None if it is valid.
+    """
     if not ain:
-        msg = "null or empty ain"
-        response = jsonify({"state": State.user_error, "error_message": msg})
-        response.status_code = 400
-        return response
+        return "null or empty ain"
 
     if not ain.isdigit():
-        msg = "ain must be a number"
-        response = jsonify({"state": State.user_error, "error_message": msg})
-        response.status_code = 400
-        return response
+        return "ain must be a number"
 
     # immediately fail if ain is not of the right length
     if len(ain) != 9 and len(ain) != 8:
-        msg = "ain is wrong length"
-        response = jsonify({"state": State.user_error, "error_message": msg})
-        response.status_code = 400
-        return response
+        return "ain is wrong length"
 
-    return "valid"
+    return None
 
 
-def validate_callback_url(callback_url):
+def get_callback_url_error(callback_url):
+    """ Returns the error message for an invalid callback url, None if it is
+    valid.
+    """
     # check callback url not null or empty
     if not callback_url:
-        response = jsonify(
-            {"state": State.user_error, "error_message": "callback url null or empty"}
-        )
-        response.status_code = 400
-        return response
+        return "callback url null or empty"
+
+    if not isinstance(callback_url, str):
+        return "callback url must be a string"
 
     # check that callback url is a url
     parsed_url = urlparse(callback_url)
     if not bool(parsed_url.scheme):
-        response = jsonify(
-            {"state": State.user_error, "error_message": "callback url not valid"}
-        )
-        response.status_code = 400
-        return response
+        return "callback url not valid"
+
+    return None
+
+
+def user_error_response(msg):
+    response = jsonify({"state": State.user_error, "error_message": msg})
+    response.status_code = 400
+    return response
+
+
+def validate_ain(ain):
+    msg = get_ain_error(ain)
+    if msg is not None:
+        return user_error_response(msg)
+
+    return "valid"
+
+
+def validate_callback_url(callback_url):
+    msg = get_callback_url_error(callback_url)
+    if msg is not None:
+        return user_error_response(msg)
 
     return "valid"
@@ -12,9 +12,63 @@ class Config(object):
     call_twilio_account_sid = os.getenv("CALL_TWILIO_ACCOUNT_SID")
     call_twilio_auth_token = os.getenv("CALL_TWILIO_AUTH_TOKEN")
     call_twilio_local_number = os.getenv("CALL_TWILIO_LOCAL_NUMBER")
+    # more accounts and numbers to spread calls over, as comma separated
+    # "account_sid:auth_token:local_number"
+    call_twilio_additional_callers = [
+        tuple(caller.strip().split(":"))
+        for caller in os.getenv("CALL_TWILIO_ADDITIONAL_CALLERS", "").split(",")
+        if caller.strip()
+    ]
+    # "round_robin" or "least_loaded"
+    call_twilio_caller_selection = os.getenv(
+        "CALL_TWILIO_CALLER_SELECTION", "round_robin"
+    )
     call_number_to_call = os.getenv("CALL_NUMBER_TO_CALL")
     call_final_pause_secs = os.getenv("CALL_FINAL_PAUSE", 45)
     call_initial_pause_secs = os.getenv("CALL_INITIAL_PAUSE", 0)
+    # limits shared by all workers, see api.call_limiter
+    call_rate_limit_per_sec = float(os.getenv("CALL_RATE_LIMIT_PER_SECOND", 1))
+    call_rate_limit_burst = int(os.getenv("CALL_RATE_LIMIT_BURST", 1))
+    # maximum number of calls in progress at once, 0 for no limit
+    call_max_concurrent = int(os.getenv("CALL_MAX_CONCURRENT", 0))
+    call_slot_ttl_secs = int(os.getenv("CALL_SLOT_TTL_SECONDS", 900))
+    call_slot_wait_secs = int(os.getenv("CALL_SLOT_WAIT_SECONDS", 30))
+    # public url of the /call_status route, twilio posts to it when a call ends
+    call_status_callback_url = os.getenv("CALL_STATUS_CALLBACK_URL")
+    # when status callbacks are enabled, the first poll of the call status is
+    # only a safety net in case the callback never arrives
+    call_status_poll_countdown_secs = int(
+        os.getenv(
+            "CALL_STATUS_POLL_COUNTDOWN", 600 if call_status_callback_url else 60
+        )
+    )
+
+    # repeated requests for an ain
+    # a request for an ain being processed is attached to the running chain
+    # instead of placing another call, for at most this long
+    process_inflight_ttl_secs = int(os.getenv("PROCESS_INFLIGHT_TTL_SECONDS", 7200))
+    # if not 0, requests for an ain processed less than this long ago are
+    # answered with the stored result
+    process_result_freshness_secs = int(
+        os.getenv("PROCESS_RESULT_FRESHNESS_SECONDS", 0)
+    )
+
+    # maximum number of ains in a /process_batch request
+    process_batch_max_size = int(os.getenv("PROCESS_BATCH_MAX_SIZE", 10000))
+
+    # extraction
+    zipcode_index_snapshot_path = os.getenv("ZIPCODE_INDEX_SNAPSHOT_PATH")
+    extraction_cache_size = int(os.getenv("EXTRACTION_CACHE_SIZE", 1024))
+    extraction_cache_ttl_secs = int(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", 86400))
+    # share the cache between workers through the celery result backend (redis)
+    extraction_cache_use_redis = (
+        os.getenv("EXTRACTION_CACHE_USE_REDIS", "false").lower() == "true"
+    )
+
+    # outbound http requests
+    http_pool_size = int(os.getenv("HTTP_POOL_SIZE", 10))
+    http_timeout_secs = int(os.getenv("HTTP_TIMEOUT_SECONDS", 30))
+    http_max_retries = int(os.getenv("HTTP_MAX_RETRIES", 3))
 
     # tokens
     token_secret_key = os.getenv("TOKEN_SECRET_KEY")
@@ -22,15 +76,56 @@ class Config(object):
     token_sign_algorithm = os.getenv("TOKEN_SIGN_ALGORITHM", "HS256")
 
     # speech to text config
+    transcript_cache_size = int(os.getenv("TRANSCRIPT_CACHE_SIZE", 256))
+    transcript_cache_ttl_secs = int(os.getenv("TRANSCRIPT_CACHE_TTL_SECONDS", 86400))
+    # share the cache between workers through the celery result backend (redis)
+    transcript_cache_use_redis = (
+        os.getenv("TRANSCRIPT_CACHE_USE_REDIS", "false").lower() == "true"
+    )
+    # "google" or "azure"
+    speech_to_text_provider = os.getenv("SPEECH_TO_TEXT_PROVIDER", "google").lower()
+    # if set, recordings are also sent to this provider when the first one hasn't
+    # answered within the hedge delay (about its p95 latency)
+    speech_to_text_hedge_provider = os.getenv("SPEECH_TO_TEXT_HEDGE_PROVIDER")
+    speech_to_text_hedge_delay_secs = float(
+        os.getenv("SPEECH_TO_TEXT_HEDGE_DELAY", 20)
+    )
     google_credentials_json = base64.urlsafe_b64decode(
         os.getenv("GOOGLE_CREDENTIALS_JSON").encode("utf8")
     ).decode("utf8")
     azure_speech_key = os.getenv("AZURE_SPEECH_KEY")
+    # keep a google speech client per worker process instead of setting one up
+    # for every transcription
+    google_use_speech_client = (
+        os.getenv("GOOGLE_USE_SPEECH_CLIENT", "true").lower() == "true"
+    )
 
     # celery config
     celery_broker = os.getenv("CELERY_BROKER_URL")
     celery_result_backend = os.getenv("CELERY_RESULT_BACKEND")
     celery_timezone = "UTC"
+    # keep retries and delays of at least celery_delayed_min_countdown_secs in
+    # a redis sorted set rather than in worker memory, see api.delayed
+    celery_delayed_scheduler = (
+        os.getenv("CELERY_DELAYED_SCHEDULER", "false").lower() == "true"
+    )
+    celery_delayed_min_countdown_secs = int(
+        os.getenv("CELERY_DELAYED_MIN_COUNTDOWN", 10)
+    )
+    celery_delayed_poll_secs = float(os.getenv("CELERY_DELAYED_POLL_SECONDS", 1))
+    # send each stage to its own queue, see the worker profiles in the README
+    celery_route_tasks = os.getenv("CELERY_ROUTE_TASKS", "false").lower() == "true"
+    # run the stages after the call in a single task, see PostCallPipeline
+    celery_fused_pipeline = (
+        os.getenv("CELERY_FUSED_PIPELINE", "false").lower() == "true"
+    )
+    # "redis" or "disk" to pass transcripts and extracted info between stages
+    # as references to a content store (see api.content_store), empty to pass
+    # them as task arguments
+    content_store = os.getenv("CONTENT_STORE", "").lower()
+    # for the disk store, a directory shared by all workers
+    content_store_directory = os.getenv("CONTENT_STORE_DIRECTORY", "content_store")
+    content_store_ttl_secs = int(os.getenv("CONTENT_STORE_TTL_SECONDS", 86400))
 
     # auth temporary
     auth_user = os.getenv("AUTH_USER")
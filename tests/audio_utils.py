@@ -0,0 +1,14 @@
+import io
+import wave
+
+
+def make_wav(seconds=2, rate=8000):
+    """ Returns the bytes of a mono 16 bit wav file of the given length.
+    """
+    audio = io.BytesIO()
+    with wave.open(audio, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\x00\x01" * rate * seconds)
+    return audio.getvalue()
@@ -0,0 +1,313 @@
+import json
+import unittest
+from unittest import mock
+
+import jwt
+from twilio.request_validator import RequestValidator
+
+from api.app import (
+    app,
+    celery,
+    extract_info,
+    post_call_chain,
+    post_call_pipeline,
+    route_tasks,
+    send_error,
+)
+from api.state import State
+from config import Config
+
+
+class TestCallStatusCallback(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.url = "/call_status?ain=012345678&callback_url=cb&outer_task_id=task"
+
+    @mock.patch("api.app.post_call_chain")
+    @mock.patch("api.app.RequestValidator")
+    def test_rejects_unsigned_requests(self, validator, post_call_chain):
+        validator.return_value.validate.return_value = False
+        response = self.client.post(self.url, data={"CallSid": "CA1"})
+
+        self.assertEqual(response.status_code, 403)
+        post_call_chain.assert_not_called()
+
+    @mock.patch("api.app.post_call_chain")
+    @mock.patch("api.app.RequestValidator")
+    def test_continues_chain_when_call_ends(self, validator, post_call_chain):
+        validator.return_value.validate.return_value = True
+        response = self.client.post(
+            self.url, data={"CallSid": "CA1", "CallStatus": "completed"}
+        )
+
+        self.assertEqual(response.status_code, 204)
+        post_call_chain.assert_called_with("012345678", "cb", "task")
+        post_call_chain.return_value.apply_async.assert_called_with(
+            args=("CA1",), task_id="task"
+        )
+
+    @mock.patch.object(Config, "call_status_callback_url", "https://example.com/cs")
+    @mock.patch.object(Config, "call_twilio_account_sid", "AC1")
+    @mock.patch.object(Config, "call_twilio_auth_token", "token1")
+    @mock.patch.object(
+        Config, "call_twilio_additional_callers", [("AC2", "token2", "+15550002")]
+    )
+    @mock.patch("api.app.post_call_chain")
+    def test_accepts_additional_account_signature(self, post_call_chain):
+        data = {"AccountSid": "AC2", "CallSid": "CA1", "CallStatus": "completed"}
+        url = "https://example.com/cs?" + self.url.split("?")[1]
+        signature = RequestValidator("token2").compute_signature(url, data)
+
+        response = self.client.post(
+            self.url, data=data, headers={"X-Twilio-Signature": signature}
+        )
+
+        self.assertEqual(response.status_code, 204)
+        post_call_chain.assert_called_with("012345678", "cb", "task")
+
+        # signed with another account's token
+        signature = RequestValidator("token1").compute_signature(url, data)
+        response = self.client.post(
+            self.url, data=data, headers={"X-Twilio-Signature": signature}
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+def auth_headers():
+    token = jwt.encode({"has_access": True}, "secret", algorithm="HS256")
+    if isinstance(token, bytes):
+        token = token.decode("utf8")
+    return {"Authorization": f"Bearer {token}"}
+
+
+@mock.patch.object(Config, "token_secret_key", "secret")
+class TestProcess(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+
+    def post_process(self):
+        return self.client.post(
+            "/process",
+            data={"ain": "12345678", "callback_url": "http://example.com/cb"},
+            headers=auth_headers(),
+        )
+
+    @mock.patch("api.app.AsyncResult")
+    @mock.patch("api.app.chain")
+    @mock.patch("api.app.inflight")
+    def test_attaches_to_inflight_chain(self, inflight, chain, async_result):
+        inflight.get_result.return_value = None
+        inflight.register.return_value = "inflight_task"
+        async_result.return_value.task_id = "inflight_task"
+        async_result.return_value.state = "calling"
+
+        response = self.post_process()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["task_id"], "inflight_task")
+        inflight.register.assert_called_once_with(
+            "012345678", mock.ANY, "http://example.com/cb"
+        )
+        chain.assert_not_called()
+
+    @mock.patch("api.app.send_result")
+    @mock.patch("api.app.chain")
+    @mock.patch("api.app.inflight")
+    def test_answers_from_fresh_result(self, inflight, chain, send_result):
+        inflight.get_result.return_value = {"hearing_date_time": None}
+        result = send_result.s.return_value.apply_async.return_value
+        result.task_id = "task"
+        result.state = "PENDING"
+
+        response = self.post_process()
+
+        self.assertEqual(response.get_json()["data"], {"hearing_date_time": None})
+        self.assertFalse(send_result.s.call_args[1]["fan_out"])
+        inflight.register.assert_not_called()
+        chain.assert_not_called()
+
+    @mock.patch("api.app.process_chain")
+    @mock.patch("api.app.inflight")
+    def test_unregisters_when_queueing_fails(self, inflight, process_chain):
+        inflight.get_result.return_value = None
+        inflight.register.side_effect = lambda ain, task_id, url: task_id
+        process_chain.return_value.apply_async.side_effect = OSError
+
+        response = self.post_process()
+
+        self.assertEqual(response.status_code, 503)
+        task_id = inflight.register.call_args[0][1]
+        inflight.finish.assert_called_once_with("012345678", task_id)
+
+
+@mock.patch.object(Config, "token_secret_key", "secret")
+@mock.patch("api.app.send_result")
+@mock.patch("api.app.process_chain")
+@mock.patch("api.app.inflight")
+class TestProcessBatch(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+
+    def post_batch(self, data, content_type="application/json"):
+        return self.client.post(
+            "/process_batch",
+            data=data,
+            content_type=content_type,
+            headers=auth_headers(),
+        )
+
+    def test_batch(self, inflight, process_chain, send_result):
+        # the second ain is answered from a stored result, the third is in flight
+        inflight.get_results.return_value = [None, {"hearing_date_time": None}, None]
+        inflight.register_many.side_effect = lambda requests: [
+            requests[0][1],
+            "inflight_task",
+        ]
+
+        batch = [
+            {"ain": "12345678", "callback_url": "http://example.com/cb"},
+            {"ain": "abc", "callback_url": "http://example.com/cb"},
+            {"ain": "123456789", "callback_url": "http://example.com/cb"},
+            {"ain": "987654321", "callback_url": "http://example.com/cb"},
+        ]
+        response = self.post_batch(json.dumps(batch))
+        results = response.get_json()["results"]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(results[1]["error_message"], "ain must be a number")
+        self.assertEqual(
+            [result.get("ain") for result in results],
+            ["012345678", "abc", "123456789", "987654321"],
+        )
+        self.assertEqual(results[2]["data"], {"hearing_date_time": None})
+        self.assertEqual(results[3]["task_id"], "inflight_task")
+
+        inflight.get_results.assert_called_once_with(
+            ["012345678", "123456789", "987654321"]
+        )
+        process_chain.assert_called_once_with(
+            "012345678", "http://example.com/cb", results[0]["task_id"]
+        )
+        send_result.s.return_value.apply_async.assert_called_once()
+
+    def test_json_lines(self, inflight, process_chain, send_result):
+        inflight.get_results.return_value = [None, None]
+        inflight.register_many.side_effect = lambda requests: [
+            task_id for _, task_id, _ in requests
+        ]
+
+        lines = [
+            {"ain": "123456789", "callback_url": "http://example.com/cb"},
+            {"ain": "987654321", "callback_url": "http://example.com/cb"},
+        ]
+        response = self.post_batch(
+            "\n".join(json.dumps(line) for line in lines) + "\n",
+            content_type="application/x-ndjson",
+        )
+
+        self.assertEqual(len(response.get_json()["results"]), 2)
+        self.assertEqual(process_chain.call_count, 2)
+
+    def test_non_string_callback_url(self, inflight, process_chain, send_result):
+        inflight.get_results.return_value = []
+        inflight.register_many.return_value = []
+
+        response = self.post_batch(
+            json.dumps([{"ain": "123456789", "callback_url": 5}])
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["results"][0]["state"], State.user_error)
+        process_chain.assert_not_called()
+
+    def test_queueing_failure(self, inflight, process_chain, send_result):
+        inflight.get_results.return_value = [None, None]
+        inflight.register_many.side_effect = lambda requests: [
+            task_id for _, task_id, _ in requests
+        ]
+        process_chain.return_value.apply_async.side_effect = [OSError, mock.Mock()]
+
+        batch = [
+            {"ain": "123456789", "callback_url": "http://example.com/cb"},
+            {"ain": "987654321", "callback_url": "http://example.com/cb"},
+        ]
+        response = self.post_batch(json.dumps(batch))
+        results = response.get_json()["results"]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(results[0]["state"], State.error)
+        self.assertIn("task_id", results[1])
+        task_id = process_chain.call_args_list[0][0][2]
+        inflight.finish.assert_called_once_with("123456789", task_id)
+
+    def test_invalid_body(self, inflight, process_chain, send_result):
+        response = self.post_batch(json.dumps({"ain": "123456789"}))
+
+        self.assertEqual(response.status_code, 400)
+        process_chain.assert_not_called()
+
+
+@mock.patch.object(Config, "token_secret_key", "secret")
+class TestStatus(unittest.TestCase):
+    @mock.patch("api.tasks.content_store")
+    @mock.patch("api.app.AsyncResult")
+    def test_resolves_data_reference(self, async_result, content_store):
+        async_result.return_value.task_id = "task"
+        async_result.return_value.state = "sending_to_callback_error"
+        async_result.return_value.info = {"error_message": "err", "data_ref": "ref"}
+        content_store.get.return_value = {"date": "random_data"}
+
+        response = app.test_client().get("/status/task", headers=auth_headers())
+
+        content_store.get.assert_called_with("ref")
+        self.assertEqual(
+            response.get_json()["data"],
+            {"error_message": "err", "data": {"date": "random_data"}},
+        )
+
+
+class TestTaskRouting(unittest.TestCase):
+    def tearDown(self):
+        celery.conf.update(CELERY_ROUTES=None)
+
+    def test_route_tasks(self):
+        route_tasks()
+        router = celery.amqp.router
+
+        self.assertEqual(router.route({}, extract_info.name)["queue"].name, "extract")
+        self.assertEqual(router.route({}, send_error.name)["queue"].name, "io")
+
+    @mock.patch.object(Config, "celery_fused_pipeline", True)
+    def test_fused_pipeline(self):
+        tasks = post_call_chain("012345678", "cb", "task").tasks
+
+        self.assertEqual(len(tasks), 2)
+        self.assertEqual(tasks[1].task, post_call_pipeline.name)
+        self.assertEqual(tasks[1].args, ("012345678", "cb"))
+
+    @mock.patch.object(Config, "token_secret_key", "secret")
+    @mock.patch("api.app.get_redis")
+    def test_queue_metrics(self, get_redis):
+        pipeline = get_redis.return_value.pipeline.return_value
+        pipeline.execute.return_value = [0, 1, 2, 3, 4, 5, 6]
+
+        response = app.test_client().get("/metrics/queues", headers=auth_headers())
+
+        self.assertEqual(
+            response.get_json(),
+            {
+                "queues": {
+                    "celery": 0,
+                    "calls": 1,
+                    "extract": 2,
+                    "io": 3,
+                    "transcribe": 4,
+                },
+                "unacked": 5,
+                "delayed": 6,
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+import numpy as np
+import speech_recognition as sr
+
+from workflow.transcribe import audio_processing
+
+
+def make_audio(pattern, rate=8000):
+    """ pattern is a list of (seconds, is_loud) """
+    parts = []
+    for seconds, is_loud in pattern:
+        t = np.arange(int(seconds * rate)) / rate
+        amplitude = 10000 if is_loud else 0
+        parts.append((amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.int16))
+    return sr.AudioData(np.concatenate(parts).tobytes(), rate, 2)
+
+
+class TestSplitAtSilences(unittest.TestCase):
+    def test_short_audio_not_split(self):
+        audio = make_audio([(10, True)])
+        self.assertEqual(
+            audio_processing.split_at_silences(audio, 55, 1), [audio]
+        )
+
+    def test_cuts_at_silence(self):
+        audio = make_audio([(40, True), (2, False), (40, True)])
+
+        segments = audio_processing.split_at_silences(audio, 55, 1)
+
+        self.assertEqual(len(segments), 2)
+        first, second = [audio_processing.get_duration_secs(s) for s in segments]
+        self.assertAlmostEqual(first, 41.5, delta=1)
+        self.assertAlmostEqual(first + second, 82 + 1, delta=0.1)
+        self.assertTrue(all(d <= 55 for d in (first, second)))
+
+    def test_segments_at_most_max_length(self):
+        audio = make_audio([(200, True)])
+
+        segments = audio_processing.split_at_silences(audio, 55, 1)
+
+        durations = [audio_processing.get_duration_secs(s) for s in segments]
+        self.assertTrue(all(d <= 55 for d in durations))
+        self.assertAlmostEqual(sum(durations) - len(segments) + 1, 200, delta=0.1)
+
+
+class TestPreprocess(unittest.TestCase):
+    def test_trims_silences(self):
+        audio = make_audio(
+            [(3, False), (2, True), (5, False), (2, True), (0.5, False), (1, True)]
+        )
+        audio = audio_processing.trim_silences(audio, max_silence_secs=1)
+
+        # 5s of speech, 0.5s before it, 1s left of the long silence and the
+        # short silence untouched
+        self.assertAlmostEqual(
+            audio_processing.get_duration_secs(audio), 5 + 0.5 + 1 + 0.5, delta=0.11
+        )
+
+    def test_silent_audio_unchanged(self):
+        audio = make_audio([(2, False)])
+        self.assertIs(audio_processing.trim_silences(audio), audio)
+
+    def test_downsamples(self):
+        audio = audio_processing.preprocess(make_audio([(1, True)], rate=16000))
+        self.assertEqual(audio.sample_rate, 8000)
+        self.assertAlmostEqual(
+            audio_processing.get_duration_secs(audio), 1, delta=0.01
+        )
+
+
+class TestStitchTranscripts(unittest.TestCase):
+    def test_removes_overlap(self):
+        self.assertEqual(
+            audio_processing.stitch_transcripts(
+                ["your next hearing is", "Hearing is on april third", "", "at 3 pm"]
+            ),
+            "your next hearing is on april third at 3 pm",
+        )
+
+    def test_no_overlap(self):
+        self.assertEqual(
+            audio_processing.stitch_transcripts(["one two", "three"]), "one two three"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
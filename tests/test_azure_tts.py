@@ -1,6 +1,12 @@
+import io
 import unittest
+from unittest import mock
+
+import azure.cognitiveservices.speech as speechsdk
 
 from config import TestConfig
+from tests.audio_utils import make_wav
+from workflow.transcribe import exceptions
 from workflow.transcribe.azure_transcribe import AzureTranscriber
 
 
@@ -17,5 +23,71 @@ class TestAzureTranscriber(unittest.TestCase):
         self.assertIsNotNone(transcript)
 
 
+def fake_recognizer(texts, error_details=None):
+    """ Returns a mock SpeechRecognizer class, whose recognizers fire a
+    recognized event for each of texts (or a canceled event with the given
+    error), then session stopped, when recognition starts.
+    """
+    recognizer = mock.Mock()
+
+    def start():
+        for text in texts:
+            recognizer.recognized.connect.call_args[0][0](
+                mock.Mock(**{"result.text": text})
+            )
+        if error_details:
+            evt = mock.Mock()
+            evt.result.cancellation_details.error_details = error_details
+            evt.result.cancellation_details.reason = speechsdk.CancellationReason.Error
+            recognizer.canceled.connect.call_args[0][0](evt)
+        recognizer.session_stopped.connect.call_args[0][0](mock.Mock())
+
+    recognizer.start_continuous_recognition.side_effect = start
+    return mock.Mock(return_value=recognizer)
+
+
+@mock.patch("workflow.transcribe.azure_transcribe.speechsdk.Connection")
+class TestAzureTranscriberInMemory(unittest.TestCase):
+    def setUp(self):
+        self.azure_transcriber = AzureTranscriber("key")
+        self.azure_transcriber.preprocess_audio = False
+
+    def test_transcribe(self, connection):
+        with mock.patch(
+            "workflow.transcribe.azure_transcribe.speechsdk.SpeechRecognizer",
+            fake_recognizer(["hello", "", "world"]),
+        ):
+            transcript = self.azure_transcriber.transcribe_audio_file_path(
+                io.BytesIO(make_wav())
+            )
+
+        self.assertEqual(transcript, "hello world")
+        connection.from_recognizer.return_value.open.assert_called_once_with(True)
+
+    def test_canceled(self, connection):
+        with mock.patch(
+            "workflow.transcribe.azure_transcribe.speechsdk.SpeechRecognizer",
+            fake_recognizer([], error_details="bad key"),
+        ):
+            with self.assertRaises(exceptions.Canceled):
+                self.azure_transcriber.transcribe_audio_file_path(
+                    io.BytesIO(make_wav())
+                )
+
+    @mock.patch("workflow.transcribe.download.http_session.get")
+    def test_transcribe_at_uri(self, http_get, connection):
+        response = http_get.return_value.__enter__.return_value
+        response.iter_content.return_value = [make_wav()]
+
+        with mock.patch(
+            "workflow.transcribe.azure_transcribe.speechsdk.SpeechRecognizer",
+            fake_recognizer(["hello"]),
+        ):
+            transcript = self.azure_transcriber.transcribe_audio_at_uri("uri")
+
+        self.assertEqual(transcript, "hello")
+        http_get.assert_called_with("uri", stream=True)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from unittest import mock
+
+from workflow.cache import ResultCache, hash_key
+
+
+class TestResultCache(unittest.TestCase):
+    def test_get_or_compute(self):
+        cache = ResultCache("test")
+        compute = mock.Mock(return_value={"year": 2019})
+
+        self.assertEqual(cache.get_or_compute("key", compute), {"year": 2019})
+        self.assertEqual(cache.get_or_compute("key", compute), {"year": 2019})
+
+        compute.assert_called_once()
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_lru_eviction(self):
+        cache = ResultCache("test", max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_ttl(self):
+        cache = ResultCache("test", ttl_secs=10)
+        with mock.patch("workflow.cache.time.monotonic", return_value=100):
+            cache.set("a", 1)
+        with mock.patch("workflow.cache.time.monotonic", return_value=105):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("workflow.cache.time.monotonic", return_value=111):
+            self.assertIsNone(cache.get("a"))
+
+    def test_unavailable_redis_is_a_miss(self):
+        cache = ResultCache("test", max_size=0, redis_url="redis://localhost:1/0")
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.misses, 1)
+
+    def test_hash_key(self):
+        self.assertEqual(hash_key("abc"), hash_key(b"abc"))
+        self.assertNotEqual(hash_key("abc"), hash_key("abd"))
+
+
+if __name__ == "__main__":
+    unittest.main()
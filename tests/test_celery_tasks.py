@@ -1,26 +1,250 @@
+import os
+import tempfile
 import unittest
 from unittest import mock
 
+from celery.exceptions import Ignore
+from requests.exceptions import ConnectionError
+
 from api.app import celery
-from api.tasks import SendResult
+from api.content_store import DiskContentStore
+from api.state import State
+from api.tasks import (
+    CheckCallProgress,
+    DeleteRecordings,
+    ExtractInfo,
+    InitiateCall,
+    PostCallPipeline,
+    SendResult,
+)
+from workflow.cache import ResultCache
 
 
 class TestCeleryTasks(unittest.TestCase):
     def setUp(self):
         celery.conf.update(CELERY_ALWAYS_EAGER=True)
 
-    @mock.patch("api.tasks.requests.post")
-    def test_send_result(self, requests_post):
+    @mock.patch("api.tasks.inflight")
+    @mock.patch("api.tasks.http_session.post")
+    def test_send_result(self, http_post, inflight):
+        inflight.finish.return_value = []
         data = {"date": "random_data", "location": "random_location"}
         callback_url = "callback_url"
 
         task = SendResult()
 
         # execute task
-        task(data=data, callback_url=callback_url, ain="", outer_task_id="")
+        task(
+            request={"data": data}, callback_url=callback_url, ain="", outer_task_id=""
+        )
 
         # make sure data was posted to callback_url
-        requests_post.assert_called_with(callback_url, json=data)
+        http_post.assert_called_with(callback_url, json=data)
+
+    @mock.patch("api.tasks.inflight")
+    @mock.patch("api.tasks.http_session.post")
+    def test_send_stored_result(self, http_post, inflight):
+        data = {"date": "random_data", "location": "random_location"}
+
+        result = SendResult().run(
+            {"data": data}, "012345678", "cb", outer_task_id="task", fan_out=False
+        )
+
+        # same shape as the result of a whole chain
+        self.assertEqual(result, data)
+        http_post.assert_called_with("cb", json=data)
+        inflight.finish.assert_not_called()
+
+    @mock.patch("api.tasks.inflight")
+    @mock.patch("api.tasks.http_session.post")
+    def test_send_result_fan_out(self, http_post, inflight):
+        data = {"date": "random_data", "location": "random_location"}
+        inflight.finish.return_value = ["callback_url", "other_callback_url"]
+
+        task = SendResult()
+        task(
+            request={"data": data},
+            callback_url="callback_url",
+            ain="012345678",
+            outer_task_id="task",
+        )
+
+        inflight.finish.assert_called_with("012345678", "task")
+        inflight.store_result.assert_called_with("012345678", data)
+        self.assertEqual(
+            http_post.call_args_list,
+            [
+                mock.call("callback_url", json=data),
+                mock.call("other_callback_url", json=data),
+            ],
+        )
+
+    @mock.patch("api.tasks.call_limiter")
+    @mock.patch("api.tasks.twilio.place_and_record_call", return_value="CA1")
+    def test_initiate_call_waits_for_limiter(self, place_call, call_limiter):
+        call_limiter.acquire.return_value = 30
+        task = InitiateCall()
+        task.push_request(
+            id="task", args=["012345678"], kwargs={"outer_task_id": "task"}, retries=3
+        )
+
+        with mock.patch("celery.canvas.Signature.apply_async", autospec=True) as send:
+            with self.assertRaises(Ignore):
+                task.run("012345678", outer_task_id="task")
+        task.pop_request()
+
+        signature = send.call_args[0][0]
+        self.assertEqual(send.call_args[1], {"countdown": 30})
+        # waiting for the limiter isn't counted as a retry
+        self.assertEqual(signature.options["retries"], 3)
+        place_call.assert_not_called()
+
+    @mock.patch("api.tasks.call_limiter")
+    @mock.patch("api.tasks.claim_call_end", return_value=True)
+    @mock.patch("api.tasks.twilio.fetch_status", return_value="completed")
+    def test_call_end_releases_slot(self, fetch_status, claim_call_end, call_limiter):
+        task = CheckCallProgress()
+        task.run("CA1", outer_task_id="task")
+
+        call_limiter.release.assert_called_with("task")
+
+    @mock.patch("api.tasks.claim_call_end", return_value=False)
+    @mock.patch("api.tasks.twilio.fetch_status", return_value="completed")
+    def test_call_end_handled_once(self, fetch_status, claim_call_end):
+        task = CheckCallProgress()
+
+        with self.assertRaises(Ignore):
+            task.run("CA1", outer_task_id="")
+
+        claim_call_end.assert_called_with("CA1")
+
+    @mock.patch("api.tasks.extraction_cache", ResultCache("test_extraction"))
+    @mock.patch("api.tasks.location_info.extract_location", return_value={})
+    @mock.patch("api.tasks.date_info.extract_date_time", return_value={})
+    def test_extract_info_gets_raw_text(self, extract_date_time, extract_location):
+        text = "april  thirteen\nat four thirty PM "
+
+        ExtractInfo().run({"call_sid": "CA1", "text": text}, outer_task_id="")
+
+        extract_date_time.assert_called_with(text)
+        extract_location.assert_called_with(text)
+
+    @mock.patch("api.tasks.twilio.delete_recordings")
+    @mock.patch("api.tasks.inflight")
+    @mock.patch("api.tasks.http_session.post")
+    @mock.patch("api.tasks.extract_call_info")
+    def test_passes_references_to_content_store(
+        self, extract_call_info, http_post, inflight, delete_recordings
+    ):
+        data = {"trancription": "text", "date": "random_data"}
+        extract_call_info.return_value = {"call_sid": "CA1", "data": data}
+        inflight.finish.return_value = []
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = DiskContentStore(directory)
+            with mock.patch("api.tasks.content_store", store):
+                request = {"call_sid": "CA1", "text_ref": store.put("text")}
+
+                request = ExtractInfo().run(request, outer_task_id="")
+                self.assertEqual(set(request), {"call_sid", "text_ref", "data_ref"})
+                self.assertEqual(extract_call_info.call_args[0][1]["text"], "text")
+                # running it again finds the transcript still there
+                store.delete(ExtractInfo().run(request, outer_task_id="")["data_ref"])
+
+                request = SendResult().run(request, "", "cb", outer_task_id="")
+                http_post.assert_called_with("cb", json=data)
+
+                self.assertEqual(DeleteRecordings().run(request), data)
+                # the payloads are deleted once the chain is done
+                self.assertEqual(os.listdir(directory), [])
+
+    @mock.patch("api.tasks.content_store")
+    @mock.patch("api.tasks.http_session.post", side_effect=ValueError)
+    def test_failure_meta_references_data(self, http_post, content_store):
+        task = SendResult()
+
+        with mock.patch.object(task, "update_state") as update_state:
+            with self.assertRaises(ValueError):
+                task.run({"data_ref": "ref"}, "", "cb", outer_task_id="task")
+
+        self.assertEqual(
+            update_state.call_args[1]["meta"],
+            {"error_message": SendResult.default_error_message, "data_ref": "ref"},
+        )
+
+
+@mock.patch("api.tasks.time.sleep")
+@mock.patch("api.tasks.inflight")
+@mock.patch("api.tasks.http_session.post")
+@mock.patch("api.tasks.extract_call_info")
+@mock.patch("api.tasks.transcriber")
+@mock.patch("api.tasks.twilio")
+class TestPostCallPipeline(unittest.TestCase):
+    def run_pipeline(self, task):
+        with mock.patch.object(task, "update_state") as update_state:
+            result = task.run(
+                {"call_sid": "CA1"}, "012345678", "callback_url", outer_task_id="task"
+            )
+        return result, [c[1]["state"] for c in update_state.call_args_list]
+
+    def test_runs_all_stages(
+        self, twilio, transcriber, extract_call_info, http_post, inflight, sleep
+    ):
+        twilio.fetch_recordings.return_value = ["RE1"]
+        transcriber.transcribe_audio_at_uri.return_value = "text"
+        extract_call_info.return_value = {"call_sid": "CA1", "data": {"a": 1}}
+        inflight.finish.return_value = []
+
+        result, states = self.run_pipeline(PostCallPipeline())
+
+        self.assertEqual(result, {"a": 1})
+        self.assertEqual(
+            states,
+            [
+                State.recording_ready,
+                State.transcribing,
+                State.transcribing_done,
+                State.sending_to_callback_done,
+            ],
+        )
+        http_post.assert_called_with("callback_url", json={"a": 1})
+        twilio.delete_recordings.assert_called_with("CA1")
+        sleep.assert_not_called()
+
+    def test_retries_stage_in_place(
+        self, twilio, transcriber, extract_call_info, http_post, inflight, sleep
+    ):
+        twilio.fetch_recordings.side_effect = [ConnectionError, ["RE1"]]
+        extract_call_info.return_value = {"call_sid": "CA1", "data": {}}
+        inflight.finish.return_value = []
+
+        self.run_pipeline(PostCallPipeline())
+
+        self.assertEqual(twilio.fetch_recordings.call_count, 2)
+        sleep.assert_called_once()
+
+    def test_sets_error_state_after_max_retries(
+        self, twilio, transcriber, extract_call_info, http_post, inflight, sleep
+    ):
+        twilio.fetch_recordings.return_value = ["RE1"]
+        extract_call_info.return_value = {"call_sid": "CA1", "data": {}}
+        http_post.side_effect = ConnectionError
+        task = PostCallPipeline()
+
+        with mock.patch.object(task, "update_state") as update_state:
+            with self.assertRaises(ConnectionError):
+                task.run(
+                    {"call_sid": "CA1"},
+                    "012345678",
+                    "callback_url",
+                    outer_task_id="task",
+                )
+
+        self.assertEqual(http_post.call_count, SendResult.max_retries + 1)
+        self.assertEqual(
+            update_state.call_args[1]["state"], State.sending_to_callback_error
+        )
+        twilio.delete_recordings.assert_not_called()
 
 
 if __name__ == "__main__":
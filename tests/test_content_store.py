@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from api.content_store import ContentMissing, DiskContentStore, RedisContentStore
+
+
+class TestRedisContentStore(unittest.TestCase):
+    def setUp(self):
+        self.redis = mock.Mock()
+        self.store = RedisContentStore(lambda: self.redis, ttl_secs=60)
+
+    def test_put_and_get(self):
+        ref = self.store.put({"text": "hello"})
+
+        (key, raw), kwargs = self.redis.set.call_args
+        self.assertEqual(key, f"content:{ref}")
+        self.assertEqual(kwargs, {"ex": 60})
+
+        self.redis.get.return_value = raw
+        self.assertEqual(self.store.get(ref), {"text": "hello"})
+
+    def test_missing(self):
+        self.redis.get.return_value = None
+
+        with self.assertRaises(ContentMissing):
+            self.store.get("ref")
+
+
+class TestDiskContentStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = DiskContentStore(self.directory.name, ttl_secs=60)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_put_get_delete(self):
+        ref = self.store.put("hello")
+        self.assertEqual(self.store.get(ref), "hello")
+
+        self.store.delete(ref)
+        with self.assertRaises(ContentMissing):
+            self.store.get(ref)
+
+    def test_expired(self):
+        ref = self.store.put("hello")
+        path = os.path.join(self.directory.name, f"{ref}.json")
+        os.utime(path, (time.time() - 120, time.time() - 120))
+
+        with self.assertRaises(ContentMissing):
+            self.store.get(ref)
+        self.assertFalse(os.path.exists(path))
+
+    def test_purge_expired(self):
+        old_ref = self.store.put("old")
+        path = os.path.join(self.directory.name, f"{old_ref}.json")
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        ref = self.store.put("new")
+
+        self.assertEqual(self.store.purge_expired(), 1)
+        self.assertEqual(self.store.get(ref), "new")
+
+
+if __name__ == "__main__":
+    unittest.main()
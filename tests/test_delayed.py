@@ -0,0 +1,102 @@
+import unittest
+from unittest import mock
+
+from celery.exceptions import Ignore, Retry
+from kombu.utils import json
+
+from api.app import check_call_progress
+from api.delayed import DelayedScheduler
+from config import Config
+
+
+class TestDelayedScheduler(unittest.TestCase):
+    def setUp(self):
+        self.redis = mock.Mock()
+        self.app = mock.Mock()
+        self.scheduler = DelayedScheduler(lambda: self.redis, app=self.app)
+
+    @mock.patch("api.delayed.time.time", return_value=100)
+    def test_schedule(self, time):
+        self.scheduler.schedule(check_call_progress.s("CA1", outer_task_id="x"), 60)
+
+        (key, entries), _ = self.redis.zadd.call_args
+        [(data, due)] = entries.items()
+        self.assertEqual(due, 160)
+        self.assertEqual(json.loads(data)["args"], ["CA1"])
+
+    def test_release_due(self):
+        self.redis.eval.return_value = [json.dumps({"task": "a"})]
+
+        self.assertEqual(self.scheduler.release_due(), 1)
+        self.app.signature.assert_called_with({"task": "a"})
+        self.app.signature.return_value.apply_async.assert_called_once()
+        # the task's lease is only dropped once it is published
+        self.redis.zrem.assert_called_once_with(
+            DelayedScheduler.processing_key, json.dumps({"task": "a"})
+        )
+
+    def test_unpublished_task_kept_in_processing(self):
+        self.redis.eval.return_value = [json.dumps({"task": "a"})]
+        self.app.signature.return_value.apply_async.side_effect = SystemExit
+
+        # e.g. the worker shutting down before the task is published
+        with self.assertRaises(SystemExit):
+            self.scheduler.release_due()
+
+        self.redis.zrem.assert_not_called()
+
+    def test_unpublished_tasks_put_back(self):
+        due = [json.dumps({"task": "a"}), json.dumps({"task": "b"})]
+        self.redis.eval.return_value = due
+        self.app.signature.return_value.apply_async.side_effect = [None, OSError]
+
+        self.assertEqual(self.scheduler.release_due(), 1)
+        pipeline = self.redis.pipeline.return_value
+        (key, entries), _ = pipeline.zadd.call_args
+        self.assertEqual(list(entries), due[1:])
+        pipeline.zrem.assert_called_with(DelayedScheduler.processing_key, *due[1:])
+
+
+@mock.patch.object(Config, "celery_delayed_scheduler", True)
+@mock.patch("api.tasks.delayed_scheduler.schedule")
+class TestDelayedTask(unittest.TestCase):
+    def setUp(self):
+        check_call_progress.push_request(
+            id="task",
+            retries=2,
+            called_directly=False,
+            is_eager=False,
+            args=["CA1"],
+            kwargs={"outer_task_id": "task", "delay_secs": 600},
+        )
+        self.addCleanup(check_call_progress.pop_request)
+
+    def test_retry(self, schedule):
+        with self.assertRaises(Retry):
+            check_call_progress.retry(countdown=60)
+
+        signature, countdown = schedule.call_args[0]
+        self.assertEqual(countdown, 60)
+        self.assertEqual(signature.options["retries"], 3)
+        self.assertEqual(signature.options["task_id"], "task")
+
+    def test_short_retry_uses_countdown(self, schedule):
+        with mock.patch("celery.app.task.Task.retry", side_effect=Retry) as retry:
+            with self.assertRaises(Retry):
+                check_call_progress.retry(countdown=1)
+
+        schedule.assert_not_called()
+        retry.assert_called_once()
+
+    def test_defer(self, schedule):
+        with self.assertRaises(Ignore):
+            check_call_progress.defer(600, delay_secs=None)
+
+        signature, countdown = schedule.call_args[0]
+        self.assertEqual(countdown, 600)
+        self.assertIsNone(signature.kwargs["delay_secs"])
+        self.assertEqual(signature.options["retries"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
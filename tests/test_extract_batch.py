@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from workflow.extract import batch, location_info
+
+
+class MyTest(unittest.TestCase):
+    def setUp(self):
+        index = location_info.ZipcodeIndex({"98102": ("WA", "Seattle")})
+        patcher = mock.patch.object(location_info, "_zipcode_index", index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.texts = [
+            "april thirteen two thousand nineteen at four thirty PM",
+            "no date here in Seattle Washington 98102",
+            "april  thirteen two thousand nineteen at four thirty PM ",
+        ]
+
+    def test_extract_many(self):
+        results = batch.extract_many(self.texts)
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]["day"], 13)
+        self.assertEqual(results[0]["Zipcode"], None)
+        self.assertEqual(results[1]["City"], "Seattle")
+        self.assertEqual(results[1]["year"], None)
+        self.assertEqual(results[0], results[2])
+
+    def test_extract_many_processes(self):
+        # workers load the index from the snapshot, as they only inherit the
+        # patched one when forked
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_path = os.path.join(directory, "zipcodes.tsv.gz")
+            location_info.get_zipcode_index().save_snapshot(snapshot_path)
+
+            self.assertEqual(
+                batch.extract_many(
+                    self.texts,
+                    processes=2,
+                    chunksize=1,
+                    zipcode_index_snapshot_path=snapshot_path,
+                ),
+                batch.extract_many(self.texts),
+            )
+
+
+    def test_extract_many_loads_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_path = os.path.join(directory, "zipcodes.tsv.gz")
+            location_info.get_zipcode_index().save_snapshot(snapshot_path)
+
+            with mock.patch.object(location_info, "_zipcode_index", None):
+                with mock.patch.object(
+                    location_info.ZipcodeIndex, "from_search_engine"
+                ) as from_search_engine:
+                    results = batch.extract_many(
+                        self.texts, zipcode_index_snapshot_path=snapshot_path
+                    )
+
+        from_search_engine.assert_not_called()
+        self.assertEqual(results[1]["City"], "Seattle")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,4 @@
+import re
 import unittest
 
 from workflow.extract import date_info
@@ -87,6 +88,35 @@ class MyTest(unittest.TestCase):
             {"year": 2021, "month": 3, "day": None, "hour": 16, "minute": 30},
         )
 
+    def test_scanMatchesRegex(self):
+        s = (
+            "judge may smith at address involving march and 23rd st\n"
+            "on may 10th 2018 at 3 p.m. or june 1st at 9 am in dismay am"
+        )
+        self.assertEqual(
+            date_info.scan_date_candidates(s),
+            re.findall(date_info.get_re_for_date_parsing(), s),
+        )
+
+    def test_possibleDateTimesOrderedByLength(self):
+        self.assertEqual(
+            date_info.find_possible_date_times(
+                "31 may st new york new york on april 3rd, 2017 at 1:30 p.m.", False
+            ),
+            [
+                "april 3rd, 2017 at 1:30 p.m.",
+                "may st new york new york on april 3rd, 2017 at 1:30 p.m.",
+            ],
+        )
+
+    def test_parseDateFields(self):
+        self.assertDictEqual(
+            date_info.parse_date_fields("march 2021 at 4:30 pm"),
+            {"year": 2021, "month": 3, "day": None, "hour": 16, "minute": 30},
+        )
+        self.assertIsNone(date_info.parse_date_fields("february 30th 2020 at 3 pm"))
+        self.assertIsNone(date_info.parse_date_fields("may st new york at 3 pm"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,4 +1,7 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
 
 from workflow.extract import location_info
 
@@ -51,5 +54,42 @@ class MyTest(unittest.TestCase):
         )
 
 
+class TestZipcodeIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = location_info.ZipcodeIndex(
+            {"98102": ("WA", "Seattle"), "20022": ("DC", None)}
+        )
+
+    def test_get(self):
+        self.assertEqual(self.index.get("98102"), ("WA", "Seattle"))
+        self.assertIsNone(self.index.get("00000"))
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            snapshot_path = os.path.join(tmp_dir, "zipcodes.tsv.gz")
+            self.index.save_snapshot(snapshot_path)
+            loaded = location_info.ZipcodeIndex.from_snapshot(snapshot_path)
+
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual(loaded.get("98102"), ("WA", "Seattle"))
+        self.assertEqual(loaded.get("20022"), ("DC", None))
+
+    def test_extract_location_uses_index(self):
+        with mock.patch.object(location_info, "_zipcode_index", self.index):
+            self.assertEqual(
+                location_info.extract_location("in Seattle Washington 98102"),
+                {
+                    "State": "WA",
+                    "Zipcode": "98102",
+                    "City": "Seattle",
+                    "Confidence_location": "high",
+                },
+            )
+            self.assertEqual(
+                location_info.extract_location("texas 00000")["Confidence_location"],
+                "low",
+            )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+
+from workflow.extract import utils
+
+
+class MyTest(unittest.TestCase):
+    def test_years(self):
+        self.assertEqual(
+            utils.years_to_digits("april two thousand and twenty one"), "april , 2021"
+        )
+
+    def test_longestMatchFirst(self):
+        self.assertEqual(utils.wordnums_to_nums("twenty one"), "21")
+        self.assertEqual(utils.ordinals_to_ordinals("thirty first"), "31st")
+        self.assertEqual(utils.hour_with_min_to_time("one forty five"), "1:45")
+
+    def test_wordBoundaries(self):
+        self.assertEqual(
+            utils.replace_homonyms("see you tomorrow for the hearing"),
+            "see you tomorrow four the hearing",
+        )
+        self.assertEqual(utils.wordnums_to_nums("often someone"), "often someone")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,14 @@
+import io
 import unittest
+from unittest import mock
+
+import speech_recognition as sr
 
 from config import TestConfig
+from tests.audio_utils import make_wav
+from workflow.cache import ResultCache
+from workflow.transcribe import audio_processing, exceptions
+from workflow.transcribe.google_speech_client import GoogleSpeechClient
 from workflow.transcribe.google_transcribe import GoogleTranscriber
 
 
@@ -18,5 +26,105 @@ class TestGoogleTranscriber(unittest.TestCase):
         self.assertEqual(transcript.strip(), self.expected_text)
 
 
+class TestGoogleTranscriberDownload(unittest.TestCase):
+    def setUp(self):
+        self.google_transcriber = GoogleTranscriber(None, None)
+        self.google_transcriber.max_in_memory_audio_bytes = 1024
+        self.google_transcriber.download_chunk_size = 512
+
+    @mock.patch("speech_recognition.Recognizer.recognize_google_cloud")
+    @mock.patch("workflow.transcribe.download.http_session.get")
+    def test_streams_recording(self, http_get, recognize):
+        wav = make_wav()
+        response = http_get.return_value.__enter__.return_value
+        response.iter_content.side_effect = lambda size: (
+            wav[i : i + size] for i in range(0, len(wav), size)
+        )
+        recognize.return_value = "hello"
+
+        transcript = self.google_transcriber.transcribe_audio_at_uri("uri")
+
+        self.assertEqual(transcript, "hello")
+        http_get.assert_called_with("uri", stream=True)
+        response.iter_content.assert_called_with(512)
+        audio_data = recognize.call_args[1]["audio_data"]
+        self.assertEqual(len(audio_data.frame_data), len(wav) - 44)
+
+    @mock.patch("speech_recognition.Recognizer.recognize_google_cloud")
+    def test_long_recording_split(self, recognize):
+        self.google_transcriber.max_segment_secs = 2.5
+        wav = make_wav(seconds=3)
+
+        with sr.AudioFile(io.BytesIO(wav)) as source:
+            audio_object = sr.Recognizer().record(source)
+        first, second = audio_processing.split_at_silences(audio_object, 2.5, 1)
+
+        def transcribe(audio_data, **kwargs):
+            if audio_data.frame_data == first.frame_data:
+                return "your next hearing"
+            return "next hearing is on april third"
+
+        recognize.side_effect = transcribe
+
+        self.assertEqual(
+            self.google_transcriber.transcribe_audio_file_path(io.BytesIO(wav)),
+            "your next hearing is on april third",
+        )
+        self.assertEqual(recognize.call_count, 2)
+
+    @mock.patch("speech_recognition.Recognizer.recognize_google_cloud")
+    def test_transcript_cache(self, recognize):
+        self.google_transcriber.transcript_cache = ResultCache("transcript")
+        recognize.return_value = "hello"
+
+        for _ in range(2):
+            transcript = self.google_transcriber.transcribe_audio_file_path(
+                io.BytesIO(make_wav())
+            )
+            self.assertEqual(transcript, "hello")
+
+        transcript = self.google_transcriber.transcribe_audio_file_path(
+            io.BytesIO(make_wav(seconds=3))
+        )
+        self.assertEqual(transcript, "hello")
+        self.assertEqual(recognize.call_count, 2)
+
+
+@mock.patch("workflow.transcribe.google_speech_client.AuthorizedSession")
+@mock.patch(
+    "workflow.transcribe.google_speech_client.service_account.Credentials"
+    ".from_service_account_info"
+)
+class TestGoogleSpeechClient(unittest.TestCase):
+    def setUp(self):
+        self.audio_data = mock.Mock(sample_rate=8000)
+        self.audio_data.get_flac_data.return_value = b"flac"
+
+    def test_recognize(self, credentials, session):
+        client = GoogleSpeechClient("{}")
+        response = session.return_value.post.return_value
+        response.json.return_value = {
+            "results": [
+                {"alternatives": [{"transcript": "your next hearing "}]},
+                {"alternatives": [{"transcript": "is on april third"}]},
+            ]
+        }
+
+        transcript = client.recognize(self.audio_data, "en-US", ["hearing"])
+
+        self.assertEqual(transcript, "your next hearing is on april third")
+        body = session.return_value.post.call_args[1]["json"]
+        self.assertEqual(body["config"]["sampleRateHertz"], 8000)
+        self.assertEqual(body["config"]["speechContexts"], [{"phrases": ["hearing"]}])
+        self.assertEqual(body["audio"]["content"], "ZmxhYw==")
+
+    def test_no_results(self, credentials, session):
+        client = GoogleSpeechClient("{}")
+        session.return_value.post.return_value.json.return_value = {}
+
+        with self.assertRaises(exceptions.BadAudio):
+            client.recognize(self.audio_data, "en-US")
+
+
 if __name__ == "__main__":
     unittest.main()
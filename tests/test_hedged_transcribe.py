@@ -0,0 +1,99 @@
+import threading
+import time
+import unittest
+
+from workflow.transcribe import exceptions
+from workflow.transcribe.hedged_transcribe import HedgedTranscriber, LatencyHistogram
+
+
+class FakeTranscriber(object):
+    def __init__(self, transcript=None, error=None, delay_secs=0):
+        self.transcript = transcript
+        self.error = error
+        self.delay_secs = delay_secs
+        self.calls = 0
+        self.finished = threading.Event()
+
+    def transcribe_audio_file_path(self, audio_file_path):
+        self.calls += 1
+        time.sleep(self.delay_secs)
+        self.finished.set()
+        if self.error:
+            raise self.error
+        return self.transcript
+
+
+class TestHedgedTranscriber(unittest.TestCase):
+    def test_fast_primary(self):
+        primary = FakeTranscriber("primary")
+        secondary = FakeTranscriber("secondary")
+        transcriber = HedgedTranscriber(
+            [("primary", primary), ("secondary", secondary)], hedge_delay_secs=1
+        )
+
+        self.assertEqual(transcriber.transcribe_audio_file_path("audio"), "primary")
+        self.assertEqual(secondary.calls, 0)
+        self.assertEqual(transcriber.latencies["primary"].count, 1)
+
+    def test_slow_primary(self):
+        primary = FakeTranscriber("primary", delay_secs=0.5)
+        secondary = FakeTranscriber("secondary")
+        transcriber = HedgedTranscriber(
+            [("primary", primary), ("secondary", secondary)], hedge_delay_secs=0.05
+        )
+
+        self.assertEqual(transcriber.transcribe_audio_file_path("audio"), "secondary")
+        self.assertFalse(primary.finished.is_set())
+
+        # the loser's latency is still recorded once it finishes
+        primary.finished.wait(1)
+        time.sleep(0.05)
+        self.assertEqual(transcriber.latency_stats()["primary"]["count"], 1)
+
+    def test_failed_primary_hedges_right_away(self):
+        primary = FakeTranscriber(error=exceptions.RequestError())
+        secondary = FakeTranscriber("secondary")
+        transcriber = HedgedTranscriber(
+            [("primary", primary), ("secondary", secondary)], hedge_delay_secs=10
+        )
+
+        start = time.monotonic()
+        self.assertEqual(transcriber.transcribe_audio_file_path("audio"), "secondary")
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_blank_transcript_is_not_accepted(self):
+        primary = FakeTranscriber("")
+        secondary = FakeTranscriber("secondary", delay_secs=0.05)
+        transcriber = HedgedTranscriber(
+            [("primary", primary), ("secondary", secondary)], hedge_delay_secs=10
+        )
+
+        self.assertEqual(transcriber.transcribe_audio_file_path("audio"), "secondary")
+
+    def test_all_failed(self):
+        primary = FakeTranscriber(error=exceptions.BadAudio())
+        secondary = FakeTranscriber(error=exceptions.RequestError())
+        transcriber = HedgedTranscriber(
+            [("primary", primary), ("secondary", secondary)], hedge_delay_secs=0
+        )
+
+        with self.assertRaises(exceptions.BadAudio):
+            transcriber.transcribe_audio_file_path("audio")
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentile(self):
+        histogram = LatencyHistogram(bounds_secs=[1, 2, 5])
+        self.assertIsNone(histogram.percentile(95))
+
+        for secs in [0.5] * 90 + [1.5] * 5 + [4] * 4 + [10]:
+            histogram.observe(secs)
+
+        self.assertEqual(histogram.percentile(50), 1)
+        self.assertEqual(histogram.percentile(95), 2)
+        self.assertEqual(histogram.percentile(100), float("inf"))
+        self.assertEqual(histogram.stats()["count"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from unittest import mock
+
+from workflow import http_session
+
+
+class TestHttpSession(unittest.TestCase):
+    def tearDown(self):
+        http_session.configure(pool_size=10, timeout_secs=30, max_retries=3)
+
+    def test_session_reused(self):
+        self.assertIs(http_session.get_session(), http_session.get_session())
+
+    def test_new_session_after_fork(self):
+        session = http_session.get_session()
+        with mock.patch("workflow.http_session.os.getpid", return_value=-1):
+            self.assertIsNot(http_session.get_session(), session)
+
+    def test_default_timeout(self):
+        http_session.configure(timeout_secs=5)
+        with mock.patch("workflow.http_session.requests.Session.request") as request:
+            http_session.post("http://localhost/callback", json={})
+
+        request.assert_called_with(
+            "POST", "http://localhost/callback", json={}, timeout=5
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,9 @@ import os
 import requests
 import time
 import unittest
+from unittest import mock
+
+from twilio.base.exceptions import TwilioRestException
 
 from config import TestConfig
 
@@ -74,6 +77,123 @@ class TestTwilioCallWrapper(unittest.TestCase):
         main(TestConfig.test_call_case_number, TestConfig.test_call_recording_file)
 
 
+class TestTwilioCallWrapperRequests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("workflow.call.twilio_call_wrapper.TwilioRestClient")
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+        self.twilio = TwilioCallWrapper("sid", "token", 0, 45, "+1", "+2")
+        self.call_context = self.client.calls.get.return_value
+
+    def test_fetch_call_is_cached(self):
+        self.call_context.fetch.return_value = mock.Mock(sid="CA1", status="ringing")
+
+        self.assertEqual(self.twilio.fetch_status("CA1"), "ringing")
+        self.assertEqual(self.twilio.fetch_status("CA1"), "ringing")
+
+        self.call_context.fetch.assert_called_once()
+
+    def test_recordings_fetched_without_call(self):
+        self.twilio.delete_recordings("CA1")
+
+        self.call_context.fetch.assert_not_called()
+        self.call_context.recordings.list.assert_called_once()
+
+    def test_hangup_ended_call(self):
+        self.call_context.fetch.return_value = mock.Mock(sid="CA1", status="completed")
+
+        self.twilio.fetch_status("CA1")
+        self.twilio.hangup_call("CA1")
+
+        self.call_context.update.assert_not_called()
+
+    def test_twiml_sent_with_call(self):
+        self.client.calls.create.return_value = mock.Mock(sid="CA1")
+
+        self.assertEqual(self.twilio.place_and_record_call("123456789"), "CA1")
+
+        kwargs = self.client.calls.create.call_args[1]
+        self.assertNotIn("url", kwargs)
+        self.assertEqual(
+            kwargs["twiml"],
+            '<?xml version="1.0" encoding="UTF-8"?><Response><Pause length="0"/>'
+            '<Play digits="1ww123456789ww1ww1ww1"/><Pause length="45"/><Hangup/>'
+            "</Response>",
+        )
+
+
+class TestTwilioCallWrapperCallers(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            "workflow.call.twilio_call_wrapper.TwilioRestClient",
+            side_effect=lambda sid, token: mock.Mock(name=sid),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_twilio(self, caller_selection):
+        return TwilioCallWrapper(
+            "AC1",
+            "token1",
+            0,
+            45,
+            "+1",
+            "+10",
+            additional_callers=[("AC1", "token1", "+11"), ("AC2", "token2", "+20")],
+            caller_selection=caller_selection,
+        )
+
+    def test_round_robin(self):
+        twilio = self.make_twilio("round_robin")
+        numbers = [twilio.select_caller().local_number for _ in range(4)]
+
+        self.assertEqual(numbers, ["+10", "+11", "+20", "+10"])
+        self.assertEqual(len(twilio._clients), 2)
+
+    def test_least_loaded(self):
+        twilio = self.make_twilio("least_loaded")
+        twilio._callers[0].record_call(time.monotonic())
+        twilio._callers[1].record_call(time.monotonic())
+
+        self.assertEqual(twilio.select_caller().local_number, "+20")
+        self.assertEqual(set(twilio.caller_stats().values()), {1})
+
+    def test_calls_routed_to_placing_account(self):
+        twilio = self.make_twilio("round_robin")
+        first, _, second = twilio._callers
+        for i, caller in enumerate([first, second]):
+            caller.client.calls.create.return_value = mock.Mock(sid=f"CA{i}")
+            caller.client.calls.get.return_value.fetch.return_value = mock.Mock(
+                sid=f"CA{i}", status="ringing"
+            )
+
+        twilio.place_and_record_call("123456789")
+        twilio.select_caller()
+        twilio.place_and_record_call("123456789")
+        twilio.fetch_status("CA1")
+
+        second.client.calls.get.assert_called_with("CA1")
+        first.client.calls.get.assert_not_called()
+
+    def test_call_account_looked_up(self):
+        twilio = self.make_twilio("round_robin")
+        first, _, second = twilio._callers
+        first.client.calls.get.return_value.fetch.side_effect = TwilioRestException(
+            404, "uri"
+        )
+        second.client.calls.get.return_value.fetch.return_value = mock.Mock(
+            sid="CA1", status="completed"
+        )
+        second.client.calls.get.return_value.recordings.list.return_value = []
+
+        self.assertEqual(twilio.fetch_status("CA1"), "completed")
+        twilio.delete_recordings("CA1")
+
+        second.client.calls.get.return_value.fetch.assert_called_once()
+        second.client.calls.get.return_value.recordings.list.assert_called_once()
+
+
 if __name__ == "__main__":
     unittest.main()
 
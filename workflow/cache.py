@@ -0,0 +1,142 @@
+"""
+Small LRU + TTL cache, optionally backed by Redis so that all workers share it.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import time
+
+import redis
+
+
+_missing = object()
+
+
+def hash_key(data):
+    """ Returns a hex digest for the given str or bytes, to be used as a key.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Values are kept in a local LRU of at most max_size entries, and, if
+    redis_url is given, in Redis under "<name>:<key>". Both expire after
+    ttl_secs. Values stored in Redis must be json serializable.
+
+    Redis errors are treated as cache misses, so an unavailable Redis only
+    costs us the cache.
+    """
+
+    def __init__(self, name, max_size=1024, ttl_secs=3600, redis_url=None):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_secs = ttl_secs
+        self.redis_url = redis_url
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+
+    def _get_redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def _redis_key(self, key):
+        return f"{self.name}:{key}"
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _missing
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _missing
+
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value, ttl_secs):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_secs, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        value = self._get_local(key)
+
+        if value is _missing and self.redis_url:
+            try:
+                raw = self._get_redis().get(self._redis_key(key))
+            except redis.RedisError:
+                raw = None
+
+            if raw is not None:
+                value = json.loads(raw)
+                self._set_local(key, value, self.ttl_secs)
+
+        with self._lock:
+            if value is _missing:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl_secs=None):
+        """ Caches value for ttl_secs, or for the cache's ttl if not given.
+        """
+        if ttl_secs is None:
+            ttl_secs = self.ttl_secs
+
+        self._set_local(key, value, ttl_secs)
+
+        if self.redis_url:
+            try:
+                self._get_redis().setex(
+                    self._redis_key(key), ttl_secs, json.dumps(value)
+                )
+            except redis.RedisError:
+                pass
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+        if self.redis_url:
+            try:
+                self._get_redis().delete(self._redis_key(key))
+            except redis.RedisError:
+                pass
+
+    def get_or_compute(self, key, compute):
+        """ Returns the cached value for key, or computes, caches and returns it.
+        """
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
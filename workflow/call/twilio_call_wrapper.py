@@ -2,18 +2,70 @@
 Place a Twilio phone call and record the outcome.
 """
 
-import requests
+from collections import deque
+import functools
+from html import escape
+import itertools
+import threading
+import time
+from urllib.parse import urlencode
 
+from twilio.base.exceptions import TwilioRestException
 from twilio.rest import Client as TwilioRestClient
 
+from workflow.cache import ResultCache
+
+
+# twiml run when the call is answered: pause, send the digits, pause while the
+# message plays (and is recorded), hang up
+# https://www.twilio.com/docs/voice/twiml
+twiml_template = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    "<Response>"
+    '<Pause length="{initial_pause_secs}"/>'
+    '<Play digits="{digits}"/>'
+    '<Pause length="{final_pause_secs}"/>'
+    "<Hangup/>"
+    "</Response>"
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def build_twiml(initial_pause_secs, digits, final_pause_secs):
+    """ Returns the twiml for a call sending the given dtmf digits.
+    """
+    return twiml_template.format(
+        initial_pause_secs=escape(str(initial_pause_secs)),
+        digits=escape(digits),
+        final_pause_secs=escape(str(final_pause_secs)),
+    )
+
+
+class TwilioCaller(object):
+    """
+    A twilio account and one of its numbers, which calls can be placed from.
+    Keeps track of the calls recently placed from it.
+    """
+
+    def __init__(self, account_sid, local_number, client):
+        self.account_sid = account_sid
+        self.local_number = local_number
+        self.client = client
+
+        self._call_times = deque()
+
+    def record_call(self, now):
+        self._call_times.append(now)
+
+    def recent_call_count(self, window_secs, now):
+        """ Returns the number of calls placed in the last window_secs.
+        """
+        while self._call_times and self._call_times[0] <= now - window_secs:
+            self._call_times.popleft()
+        return len(self._call_times)
 
-class TwilioCallWrapper(object):
 
-    # use echo below to return whatever twiml is sent to it:
-    # https://www.twilio.com/labs/twimlets/echo
-    # we will specify the digits and length below
-    # note: when specifying twim_url, replace '%7B' with '{' and '%7D' with '}'
-    twiml_url = "http://twimlets.com/echo?Twiml=%3C%3Fxml%20version%3D%221.0%22%3F%3E%0A%3CResponse%3E%0A%3CPause%20length%3D%22{pauseBeforeSendingDigitsLength}%22%2F%3E%0A%3CPlay%20digits%3D%22{digits}%22%2F%3E%0A%3CPause%20length%3D%22{pauseAfterSendingDigitsLength}%22%2F%3E%0A%3CHangup%2F%3E%0A%0A%3C%2FResponse%3E&"
+class TwilioCallWrapper(object):
 
     # base is mentioned here: https://www.twilio.com/docs/voice/api/recording
     twilio_uri_base = "https://api.twilio.com"
@@ -22,6 +74,24 @@ class TwilioCallWrapper(object):
     # https://www.twilio.com/docs/voice/api/call
     # https://www.twilio.com/docs/voice/api/recording
 
+    # calls that have ended can't change anymore, so we cache them for longer
+    ended_call_statuses = ["completed", "busy", "failed", "no-answer", "canceled"]
+    call_cache_ttl_secs = 5
+    ended_call_cache_ttl_secs = 60 * 60
+
+    # error code returned when trying to update a call that has already ended
+    # https://www.twilio.com/docs/api/errors/21220
+    call_not_in_progress_error_code = 21220
+
+    # how calls are spread over the callers:
+    # "round_robin", or "least_loaded" (fewest calls in the last
+    # caller_window_secs)
+    caller_selections = ["round_robin", "least_loaded"]
+    caller_window_secs = 60
+
+    # the account each call was placed from
+    call_account_ttl_secs = 24 * 60 * 60
+
     def __init__(
         self,
         twilio_account_sid,
@@ -30,26 +100,114 @@ class TwilioCallWrapper(object):
         call_final_pause_secs,
         number_to_call,
         twilio_local_number,
+        status_callback_url=None,
+        additional_callers=None,
+        caller_selection="round_robin",
+        redis_url=None,
     ):
-        self._client = TwilioRestClient(twilio_account_sid, twilio_auth_token)
+        """
+        additional_callers: list of (account sid, auth token, local number),
+        calls are spread over these and the main account and number
+        caller_selection: see caller_selections above
+        redis_url: if given, the account each call was placed from is shared
+        through redis, so that other processes don't have to look for it
+        """
+        if caller_selection not in self.caller_selections:
+            raise ValueError(f"Unknown caller selection: {caller_selection}")
+
         self.call_initial_pause_secs = call_initial_pause_secs
         self.call_final_pause_secs = call_final_pause_secs
         self.number_to_call = number_to_call
         self.twilio_local_number = twilio_local_number
 
-    def try_callback_server(self):
-        """ Sends a request to the twiml_url
+        # one client per account, shared by the callers of that account
+        self._clients = {}
+        self._callers = []
+        for account_sid, auth_token, local_number in [
+            (twilio_account_sid, twilio_auth_token, twilio_local_number)
+        ] + list(additional_callers or []):
+            if account_sid not in self._clients:
+                self._clients[account_sid] = TwilioRestClient(account_sid, auth_token)
+            self._callers.append(
+                TwilioCaller(account_sid, local_number, self._clients[account_sid])
+            )
+
+        self._client = self._clients[twilio_account_sid]
+        self.caller_selection = caller_selection
+        self._next_callers = itertools.cycle(range(len(self._callers)))
+        self._callers_lock = threading.Lock()
+
+        self._call_accounts = ResultCache(
+            "twilio_call_accounts",
+            ttl_secs=self.call_account_ttl_secs,
+            redis_url=redis_url,
+        )
+
+        # if set, twilio posts to this url when a call ends
+        # https://www.twilio.com/docs/voice/api/call-resource#statuscallback
+        self.status_callback_url = status_callback_url
+
+        self._calls = ResultCache("twilio_calls", ttl_secs=self.call_cache_ttl_secs)
+
+    def select_caller(self):
+        """ Returns the caller to place the next call from, and records the
+        call.
         """
-        try:
-            response = requests.get(self.twiml_url)
-            if response.status_code != 200:
-                raise RuntimeError(
-                    "Server {0} not found. Can't make calls.".format(self.twiml_url)
+        with self._callers_lock:
+            now = time.monotonic()
+            # the round robin order also breaks ties between least loaded callers
+            start = next(self._next_callers)
+            callers = self._callers[start:] + self._callers[:start]
+
+            if self.caller_selection == "least_loaded":
+                caller = min(
+                    callers,
+                    key=lambda c: c.recent_call_count(self.caller_window_secs, now),
                 )
-        except requests.exceptions.ConnectionError:
-            raise RuntimeError(
-                "Server {0} not found. Can't make calls.".format(self.twiml_url)
-            )
+            else:
+                caller = callers[0]
+
+            caller.record_call(now)
+            return caller
+
+    def caller_stats(self):
+        """ Returns the number of calls placed from each number in the last
+        caller_window_secs.
+        """
+        with self._callers_lock:
+            now = time.monotonic()
+            return {
+                f"{caller.account_sid}:{caller.local_number}": (
+                    caller.recent_call_count(self.caller_window_secs, now)
+                )
+                for caller in self._callers
+            }
+
+    def _get_client(self, call_sid):
+        """ Returns the client of the account the call was placed from.
+        """
+        if len(self._clients) == 1:
+            return self._client
+
+        account_sid = self._call_accounts.get(call_sid)
+        if account_sid in self._clients:
+            return self._clients[account_sid]
+
+        # the call was placed by another process which we don't share the
+        # accounts with, so we look for it in each account
+        for account_sid, client in self._clients.items():
+            try:
+                call = client.calls.get(call_sid).fetch()
+            except TwilioRestException as exc:
+                if exc.status == 404:
+                    continue
+                raise
+
+            self._call_accounts.set(call_sid, account_sid)
+            self._cache_call(call)
+            return client
+
+        raise ValueError(f"Call {call_sid} not found in any account")
 
     def build_dtmf_sequence(self, case_number):
         """ Sequence represents the following:
@@ -79,46 +237,93 @@ class TwilioCallWrapper(object):
 
         return "1ww{case_number}ww1ww1ww1".format(case_number=case_number)
 
-    def place_and_record_call(self, case_number):
+    def place_and_record_call(self, case_number, status_callback_params=None):
         """ Places a call which is recorded.
 
+            If a status callback url was given, twilio will post to it (with
+            the given params added to the query string) once the call ends.
+
             Returns the call sid.
         """
         send_digits = self.build_dtmf_sequence(case_number)
 
-        twiml_url = self.twiml_url.format(
-            pauseBeforeSendingDigitsLength=self.call_initial_pause_secs,
-            digits=send_digits,
-            pauseAfterSendingDigitsLength=self.call_final_pause_secs,
+        # the twiml is sent along with the call, rather than fetched by twilio
+        # from a url when the call is answered
+        twiml = build_twiml(
+            self.call_initial_pause_secs, send_digits, self.call_final_pause_secs
         )
 
-        call = self._client.calls.create(
+        kwargs = {}
+        if self.status_callback_url:
+            status_callback = self.status_callback_url
+            if status_callback_params:
+                status_callback += "?" + urlencode(status_callback_params)
+
+            kwargs.update(
+                status_callback=status_callback,
+                status_callback_event=["completed"],
+                status_callback_method="POST",
+            )
+
+        caller = self.select_caller()
+        call = caller.client.calls.create(
             to=self.number_to_call,
-            from_=self.twilio_local_number,
-            url=twiml_url,
+            from_=caller.local_number,
+            twiml=twiml,
             record=True,
+            **kwargs,
         )
+        if len(self._clients) > 1:
+            self._call_accounts.set(call.sid, caller.account_sid)
 
         return call.sid
 
     def fetch_call(self, call_sid):
         """ Retrieves a call object from the call sid
+
+            Calls are cached for a few seconds (or for longer once they have
+            ended) so that consecutive operations don't each fetch them.
         """
-        return self._client.calls.get(call_sid).fetch()
+        call = self._calls.get(call_sid)
+        if call is None:
+            client = self._get_client(call_sid)
+            # looking for the call's account may have fetched it already
+            call = self._calls.get(call_sid)
+            if call is None:
+                call = client.calls.get(call_sid).fetch()
+                self._cache_call(call)
+        return call
+
+    def _cache_call(self, call):
+        ttl_secs = None
+        if call.status in self.ended_call_statuses:
+            ttl_secs = self.ended_call_cache_ttl_secs
+        self._calls.set(call.sid, call, ttl_secs)
 
     def hangup_call(self, call_sid):
         """ Ends a call if it is still in progress
 
             See: https://www.twilio.com/docs/voice/tutorials/how-to-modify-calls-in-progress-python
         """
-        call = self.fetch_call(call_sid)
-        if call.status != "completed":
-            call.update(status="completed")
+        call = self._calls.get(call_sid)
+        if call is not None and call.status in self.ended_call_statuses:
+            return
+
+        # we update the call directly rather than fetching it first, and ignore
+        # the error if it turns out it has already ended
+        try:
+            client = self._get_client(call_sid)
+            call = client.calls.get(call_sid).update(status="completed")
+            self._cache_call(call)
+        except TwilioRestException as exc:
+            if exc.code != self.call_not_in_progress_error_code:
+                raise
 
     def delete_call(self, call_sid):
         """ Deletes the call with the given call sid
         """
-        self.fetch_call(call_sid).delete()
+        self._get_client(call_sid).calls.get(call_sid).delete()
+        self._calls.delete(call_sid)
 
     def fetch_status(self, call_sid):
         """ Get the status of the call with the given call sid
@@ -128,8 +333,7 @@ class TwilioCallWrapper(object):
     def fetch_recordings(self, call_sid):
         """ Get list of recordings for given call sid
         """
-        call = self.fetch_call(call_sid)
-        return call.recordings.list()
+        return self._get_client(call_sid).calls.get(call_sid).recordings.list()
 
     def delete_recordings(self, call_sid):
         """ Delete all recordings for given call sid
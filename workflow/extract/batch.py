@@ -0,0 +1,81 @@
+"""
+Extract date and location info from many transcripts at once, e.g. to re-run
+extraction over stored transcripts after the rules have changed.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import sys
+
+from workflow.extract import date_info, location_info
+from workflow.extract.utils import normalize_transcript
+
+
+def extract_info(text):
+    """ Returns a single dict with the date and location info extracted from text.
+    """
+    d = {}
+    d.update(date_info.extract_date_time(text))
+    d.update(location_info.extract_location(text))
+    return d
+
+
+def extract_many(
+    texts, processes=None, chunksize=64, zipcode_index_snapshot_path=None
+):
+    """ Returns the extract_info dicts for the given texts, in the same order.
+
+    Transcripts that are identical up to whitespace are only extracted once.
+
+    processes: if greater than 1, extraction is spread over a pool of that
+    many processes, each handed chunksize transcripts at a time.
+    """
+    normalized = [normalize_transcript(text) for text in texts]
+    unique = list(dict.fromkeys(normalized))
+
+    # build the zipcode index (from the snapshot if there is one) before
+    # starting any pool, so that forked workers inherit it and other workers
+    # can load the snapshot
+    location_info.get_zipcode_index(zipcode_index_snapshot_path)
+
+    if processes and processes > 1 and len(unique) > 1:
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=location_info.get_zipcode_index,
+            initargs=(zipcode_index_snapshot_path,),
+        ) as executor:
+            results = list(executor.map(extract_info, unique, chunksize=chunksize))
+    else:
+        results = [extract_info(text) for text in unique]
+
+    results_by_text = dict(zip(unique, results))
+    return [dict(results_by_text[text]) for text in normalized]
+
+
+def main():
+    description = (
+        "Extracts date and location info from a file with one transcript per "
+        "line, and writes one json dict per line to stdout"
+    )
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("file", help="File with transcripts", type=str)
+    parser.add_argument(
+        "--processes", help="Number of processes to use", type=int, default=None
+    )
+    parser.add_argument(
+        "--zipcode-index", help="Zipcode index snapshot path", type=str, default=None
+    )
+    args = parser.parse_args()
+
+    with open(args.file) as f:
+        texts = [line.rstrip("\n") for line in f]
+
+    for d in extract_many(
+        texts, processes=args.processes, zipcode_index_snapshot_path=args.zipcode_index
+    ):
+        sys.stdout.write(json.dumps(d) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+import bisect
 import calendar
 from datetime import datetime
+import functools
 import re
 
 import dateutil.parser as dparser
@@ -39,6 +41,15 @@ def create_digits_for_date_parsing(s):
     return s
 
 
+months = [month.lower() for month in calendar.month_name[1:]]
+
+# a month followed by a space starts a candidate date, and the first am/pm
+# after it (preceded by a space) ends it
+month_re = re.compile(r"(?:{}) ".format("|".join(months)))
+am_pm_re = re.compile(r" (?:a\.m\.|p\.m\.|am|pm)")
+
+
+@functools.lru_cache(maxsize=None)
 def get_re_for_date_parsing():
     """
     Basically matches strings beginning with a month, and ending in AM or PM
@@ -50,12 +61,43 @@ def get_re_for_date_parsing():
         'may st new york new york on april 3rd, 2017 at 1:30 p.m.'
     and
         'april 3rd, 2017 at 1:30 p.m.'
+
+    Note: find_possible_date_times uses the linear scan in scan_date_candidates,
+    which finds the same matches without backtracking over the whole string for
+    every month.
     """
-    months = list(map(lambda x: x.lower(), list(calendar.month_name)[1:]))  # py 3
     months_or = "|".join(months)
     return r"(?=((?:{months_or}) .*? (?:a\.m\.|p\.m\.|am|pm)))".format(**locals())
 
 
+def scan_date_candidates(s):
+    """ Returns the strings matched by get_re_for_date_parsing, in order.
+
+    Every month start is paired with the first am/pm after it, found by
+    bisecting the sorted am/pm positions, so the scan is linear in the length
+    of s rather than quadratic in the number of month names.
+    Like the regex, a candidate can't span a newline.
+    """
+    am_pm_matches = list(am_pm_re.finditer(s))
+    am_pm_starts = [match.start() for match in am_pm_matches]
+    newlines = [match.start() for match in re.finditer("\n", s)]
+
+    candidates = []
+    for month_match in month_re.finditer(s):
+        i = bisect.bisect_left(am_pm_starts, month_match.end())
+        if i == len(am_pm_starts):
+            break
+
+        am_pm_match = am_pm_matches[i]
+        j = bisect.bisect_left(newlines, month_match.end())
+        if j < len(newlines) and newlines[j] < am_pm_match.start():
+            continue
+
+        candidates.append(s[month_match.start() : am_pm_match.end()])
+
+    return candidates
+
+
 def find_possible_date_times(s, words_to_nums):
     """ Example:
     s = 'blah blah thirty one may st new york new york on april third,
@@ -70,13 +112,48 @@ def find_possible_date_times(s, words_to_nums):
     if words_to_nums:
         s = create_digits_for_date_parsing(s)
     s = s.lower()
-    q = get_re_for_date_parsing()
-    ret = list(set(re.findall(q, s)))
+    ret = list(dict.fromkeys(scan_date_candidates(s)))
     ret.sort(key=len)
     return ret
 
 
-def extract_date_time_base(s, words_to_nums=False):
+date_fields = ["year", "month", "day", "hour", "minute"]
+
+date_parser = dparser.parser()
+
+# only used to check that the parsed fields make a valid date
+validation_default = datetime(1900, 1, 1, 0, 0)
+
+
+def parse_date_fields(date):
+    """ Example:
+    'on march 2021 at 4:30 pm' -->
+    {'year': 2021, 'month': 3, 'day': None, 'hour': 16, 'minute': 30}
+
+    Returns None if the date can't be parsed.
+
+    dparser.parse always returns a full datetime, filling in missing fields
+    from a default, so we can't tell which fields were actually present.
+    Instead we use the result of the parser's tokenizing step, which leaves
+    missing fields as None, and only build a datetime from it to check that
+    the fields are valid (e.g. no february 30th).
+    """
+    try:
+        res, _ = date_parser._parse(date)
+        if res is None or len(res) == 0:
+            return None
+        date_parser._build_naive(res, validation_default)
+    except Exception:
+        # Unable to parse date
+        return None
+
+    d = {field: getattr(res, field) for field in date_fields}
+    if d["minute"] is None:
+        d["minute"] = 0
+    return d
+
+
+def extract_date_time_base(s, words_to_nums=False, parsed=None):
     """ Example:
     s = 'blah blah thirty one may st new york new york on april third,
          two thousand seventeen at one thirty PM blah blah'
@@ -93,35 +170,19 @@ def extract_date_time_base(s, words_to_nums=False):
     Loops through possible dates, returns as soon as dparser succeeds in
     parsing date (dates are ordered by length)
 
-    The parser seems to always return something, e.g.
-    'on march 2021 at 4:30 pm' -->
-    {'year': 2021, 'month': 3, 'day': 2, 'hour': 16, 'minute': 30}
-    even though 'day' should be None.
-
-    We get around this problem by adding two different defaults and checking if the
-    dict returned are the same.
+    parsed: optional dict of already parsed candidates, shared between calls
+    so that the same candidate is only parsed once.
     """
+    if parsed is None:
+        parsed = {}
+
     possible_dates = find_possible_date_times(s, words_to_nums)
-    default_1 = datetime(1900, 1, 1, 0, 0)
-    default_2 = datetime(1999, 12, 25, 23, 0)
-    fields = ["year", "month", "day", "hour", "minute"]
-    d = {}
-    for field in fields:
-        d[field] = None
     for date in possible_dates:
-        try:
-            dt_1 = dparser.parse(date, default=default_1)
-            dt_2 = dparser.parse(date, default=default_2)
-            # populate dictionary with date info
-            for key in d:
-                if dt_1.__getattribute__(key) == dt_2.__getattribute__(key):
-                    d[key] = dt_1.__getattribute__(key)
-            d["minute"] = dt_1.minute
-            return d
-        except Exception:
-            # Unable to parse date
-            pass
-    #unable to parse any dates in possible dates
+        if date not in parsed:
+            parsed[date] = parse_date_fields(date)
+        if parsed[date] is not None:
+            return dict(parsed[date])
+    # unable to parse any dates in possible dates
     return None
 
 
@@ -129,10 +190,20 @@ def extract_date_time(s):
     """ If extract_date_time_base doesn't succeed, try again after having changed words to digits
     and replaced homonyms.
     """
-    return (extract_date_time_base(s) or
-            extract_date_time_base(s, words_to_nums=True) or
-            extract_date_time_base(replace_homonyms(s), words_to_nums=True) or
-            {"year": None, "month": None, "day": None, "hour": None, "minute": None})
+    # the passes often find the same candidates, so they share parse results
+    parsed = {}
+    passes = [(s, False), (s, True)]
+
+    s_homonyms = replace_homonyms(s)
+    if s_homonyms != s:
+        passes.append((s_homonyms, True))
+
+    for text, words_to_nums in passes:
+        d = extract_date_time_base(text, words_to_nums=words_to_nums, parsed=parsed)
+        if d:
+            return d
+
+    return {field: None for field in date_fields}
 
 
 if __name__ == "__main__":
@@ -1,10 +1,105 @@
+import gzip
+import os
 import re
-
-from uszipcode import SearchEngine as ZipcodeSearchEngine
+import tempfile
+import threading
 
 from workflow.extract.utils import states_abbrev_lowercase
 
 
+class ZipcodeIndex(object):
+    """
+    In-memory zipcode -> (state, city) lookup table.
+
+    Built once per process from the uszipcode database (or from a compact
+    snapshot written by a previous process) so that lookups don't need to open
+    the sqlite database for every transcript.
+    """
+
+    def __init__(self, entries):
+        self._entries = entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, zipcode):
+        """ Returns a (state, city) tuple, or None if the zipcode is unknown.
+        """
+        return self._entries.get(zipcode)
+
+    @classmethod
+    def from_search_engine(cls):
+        """ Reads every zipcode from the uszipcode database in a single query.
+        """
+        # imported here so that loading from a snapshot doesn't require the
+        # uszipcode database to be available
+        from uszipcode import SearchEngine as ZipcodeSearchEngine
+
+        z_search = ZipcodeSearchEngine()
+        zip_klass = z_search.zip_klass
+        query = z_search.ses.query(
+            zip_klass.zipcode, zip_klass.state, zip_klass.major_city
+        )
+        entries = {zipcode: (state, city) for zipcode, state, city in query}
+        return cls(entries)
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path):
+        """ Loads an index written by save_snapshot.
+        """
+        entries = {}
+        with gzip.open(snapshot_path, "rt", encoding="utf8") as f:
+            for line in f:
+                zipcode, state, city = line.rstrip("\n").split("\t")
+                entries[zipcode] = (state or None, city or None)
+        return cls(entries)
+
+    def save_snapshot(self, snapshot_path):
+        """ Writes the index as gzipped tab separated lines.
+
+        The file is written to a temporary location first and then moved in
+        place, so concurrent workers never read a partial snapshot.
+        """
+        directory = os.path.dirname(os.path.abspath(snapshot_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw:
+                with gzip.open(raw, "wt", encoding="utf8") as f:
+                    for zipcode, (state, city) in self._entries.items():
+                        f.write(f"{zipcode}\t{state or ''}\t{city or ''}\n")
+            os.replace(tmp_path, snapshot_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
+_zipcode_index = None
+_zipcode_index_lock = threading.Lock()
+
+
+def get_zipcode_index(snapshot_path=None):
+    """ Returns the process wide zipcode index, building it on first use.
+
+    If snapshot_path is given the index is loaded from it when it exists, and
+    written to it after being built from the uszipcode database otherwise.
+    """
+    global _zipcode_index
+
+    if _zipcode_index is not None:
+        return _zipcode_index
+
+    with _zipcode_index_lock:
+        if _zipcode_index is None:
+            if snapshot_path and os.path.exists(snapshot_path):
+                _zipcode_index = ZipcodeIndex.from_snapshot(snapshot_path)
+            else:
+                _zipcode_index = ZipcodeIndex.from_search_engine()
+                if snapshot_path:
+                    _zipcode_index.save_snapshot(snapshot_path)
+
+    return _zipcode_index
+
+
 def get_re_for_location_parsing():
     states_or = "|".join(states_abbrev_lowercase.keys())
     return r"({states_or})".format(**locals()) + r" (\d{5})"
@@ -29,15 +124,16 @@ def extract_location(s):
         'Zipcode': '10983',
         'Confidence_location': 'low'}
     """
-    z_search = ZipcodeSearchEngine()
     possible_locations = find_possible_locations(s)
-    keys = ["State", "City", "Zipcode"]
     for state, zipcode in possible_locations:
-        zip_info = z_search.by_zipcode(zipcode)
-        if states_abbrev_lowercase[state.lower()] == zip_info.state:
-            d = {key: getattr(zip_info, key.lower()) for key in keys}
-            d["Confidence_location"] = "high"
-            return d
+        zip_info = get_zipcode_index().get(zipcode)
+        if zip_info and states_abbrev_lowercase[state.lower()] == zip_info[0]:
+            return {
+                "State": zip_info[0],
+                "City": zip_info[1],
+                "Zipcode": zipcode,
+                "Confidence_location": "high",
+            }
     if possible_locations != []:
         d = {
             "State": states_abbrev_lowercase[possible_locations[0][0].lower()],
@@ -1,4 +1,5 @@
 from collections import OrderedDict
+import re
 
 year_vals = OrderedDict()
 year_vals["two thousand sixteen"] = "2016"
@@ -195,6 +196,36 @@ for state in state_abbrev:
     states_abbrev_lowercase[state.lower()] = state_abbrev[state]
 
 
+class Rewriter(object):
+    """
+    Replaces every key of the given mapping by its value in a single scan.
+
+    The keys are compiled into one alternation, longest first, so that e.g.
+    'twenty one' wins over 'twenty'. Keys only match whole words, so 'to' is
+    not replaced inside 'tomorrow'.
+    """
+
+    def __init__(self, replacements):
+        self.replacements = dict(replacements)
+        keys = sorted(self.replacements, key=len, reverse=True)
+        self.pattern = re.compile(
+            r"\b(?:{})\b".format("|".join(map(re.escape, keys)))
+        )
+
+    def _replace(self, match):
+        return self.replacements[match.group(0)]
+
+    def __call__(self, s):
+        return self.pattern.sub(self._replace, s)
+
+
+_years_rewriter = Rewriter((key, ", " + val) for key, val in year_vals.items())
+_ordinals_rewriter = Rewriter(ordinals)
+_nums_rewriter = Rewriter(nums)
+_time_rewriter = Rewriter(d_time)
+_homonyms_rewriter = Rewriter(homonyms)
+
+
 def years_to_digits(s):
     """ Examples:
     'two thousand seventeen' -> '2017'
@@ -202,9 +233,7 @@ def years_to_digits(s):
 
     Up to 2030
     """
-    for val in year_vals.keys():
-        s = s.replace(val, ", " + year_vals[val])
-    return s
+    return _years_rewriter(s)
 
 
 def ordinals_to_ordinals(s):
@@ -213,9 +242,7 @@ def ordinals_to_ordinals(s):
 
     Up to 31st (intended for dates)
     """
-    for val in ordinals.keys():
-        s = s.replace(val, ordinals[val])
-    return s
+    return _ordinals_rewriter(s)
 
 
 def wordnums_to_nums(s):
@@ -226,9 +253,7 @@ def wordnums_to_nums(s):
 
     Up to 31 (intended for dates, hours, and digits in zipcodes)
     """
-    for val in nums.keys():
-        s = s.replace(val, nums[val])
-    return s
+    return _nums_rewriter(s)
 
 
 def hour_with_min_to_time(s):
@@ -237,9 +262,7 @@ def hour_with_min_to_time(s):
 
     Only considers 15, 30, 45 for now
     """
-    for val in d_time.keys():
-        s = s.replace(val, d_time[val])
-    return s
+    return _time_rewriter(s)
 
 
 def replace_homonyms(s):
@@ -249,6 +272,14 @@ def replace_homonyms(s):
     Example:
     'for' -> 'four'
     """
-    for val in homonyms.keys():
-        s = s.replace(val, homonyms[val])
-    return s
+    return _homonyms_rewriter(s)
+
+
+def normalize_transcript(s):
+    """ Collapses runs of whitespace and strips the ends, so that transcripts
+    differing only in spacing are treated the same (e.g. when caching).
+
+    Example:
+    ' april  third\n at one PM ' -> 'april third at one PM'
+    """
+    return " ".join(s.split())
@@ -0,0 +1,93 @@
+"""
+Pooled, keep-alive http session shared by all outbound requests of a process.
+
+Use get / post below instead of requests.get / requests.post so that requests
+to the same host (e.g. recording downloads from api.twilio.com, or posts to a
+client's callback url) reuse connections instead of doing a new TCP and TLS
+handshake every time.
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+settings = {
+    "pool_size": 10,
+    "timeout_secs": 30,
+    "max_retries": 3,
+    "retry_backoff_factor": 0.5,
+}
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def configure(pool_size=None, timeout_secs=None, max_retries=None):
+    """ Updates the settings used by sessions created after this call.
+    """
+    global _session
+
+    for key, value in [
+        ("pool_size", pool_size),
+        ("timeout_secs", timeout_secs),
+        ("max_retries", max_retries),
+    ]:
+        if value is not None:
+            settings[key] = value
+
+    with _session_lock:
+        _session = None
+
+
+def _create_session():
+    # only idempotent requests are retried (so not callback posts), and only
+    # on connection errors and gateway errors
+    retry = Retry(
+        total=settings["max_retries"],
+        backoff_factor=settings["retry_backoff_factor"],
+        status_forcelist=[502, 503, 504],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings["pool_size"],
+        pool_maxsize=settings["pool_size"],
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """ Returns the session for the current process.
+
+    Sessions are not shared across forks, as their connections would be.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            _session = _create_session()
+            _session_pid = pid
+        return _session
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", settings["timeout_secs"])
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
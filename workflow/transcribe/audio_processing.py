@@ -0,0 +1,190 @@
+"""
+Helpers to analyse and cut the audio of recordings before speech to text.
+
+Audio is handled as speech_recognition AudioData (mono PCM frames).
+"""
+
+import numpy as np
+
+import speech_recognition as sr
+
+
+# energies are computed over windows of this length
+energy_window_secs = 0.05
+
+# telephone audio doesn't carry anything above 4kHz, so 8kHz is enough
+target_sample_rate = 8000
+
+# windows quieter than this fraction of the loud parts of the recording (and
+# at least min_silence_energy) are considered silent
+silence_energy_ratio = 0.1
+min_silence_energy = 100
+
+
+def get_samples(audio_data):
+    """ Returns the audio's samples as a numpy array of 16 bit integers.
+    """
+    return np.frombuffer(audio_data.get_raw_data(convert_width=2), dtype=np.int16)
+
+
+def get_window_energies(samples, sample_rate, window_secs=energy_window_secs):
+    """ Returns the RMS energy of each consecutive window of the given samples
+    (a partial last window is dropped).
+    """
+    window_len = max(1, int(sample_rate * window_secs))
+    n_windows = len(samples) // window_len
+    windows = samples[: n_windows * window_len].astype(np.float64)
+    windows = windows.reshape(n_windows, window_len)
+    return np.sqrt(np.mean(windows ** 2, axis=1))
+
+
+def get_duration_secs(audio_data):
+    n_samples = len(audio_data.frame_data) / audio_data.sample_width
+    return n_samples / audio_data.sample_rate
+
+
+def get_segment(audio_data, start_secs, end_secs):
+    """ Returns the audio between the given times as a new AudioData.
+    """
+    frame_width = audio_data.sample_width
+    start = int(start_secs * audio_data.sample_rate) * frame_width
+    end = int(end_secs * audio_data.sample_rate) * frame_width
+    return sr.AudioData(
+        audio_data.frame_data[start:end], audio_data.sample_rate, frame_width
+    )
+
+
+def downsample(audio_data, sample_rate=target_sample_rate):
+    """ Returns the audio as 16 bit samples at no more than sample_rate.
+
+    Audio read by speech_recognition is already mono.
+    """
+    sample_rate = min(sample_rate, audio_data.sample_rate)
+    return sr.AudioData(
+        audio_data.get_raw_data(convert_rate=sample_rate, convert_width=2),
+        sample_rate,
+        2,
+    )
+
+
+def get_silence_threshold(energies):
+    return max(min_silence_energy, silence_energy_ratio * np.percentile(energies, 95))
+
+
+def trim_silences(audio_data, max_silence_secs=1.0, silence_threshold=None):
+    """ Drops leading and trailing silence, and shortens silences longer than
+    max_silence_secs to max_silence_secs.
+
+    Half of max_silence_secs is kept before and after speech, so that we don't
+    clip the start or end of words.
+
+    Returns 16 bit audio. If the audio is silent throughout it is returned
+    unchanged, and the speech to text service decides what to make of it.
+    """
+    samples = get_samples(audio_data)
+    energies = get_window_energies(samples, audio_data.sample_rate)
+    if len(energies) == 0:
+        return audio_data
+
+    if silence_threshold is None:
+        silence_threshold = get_silence_threshold(energies)
+
+    loud = energies > silence_threshold
+    if not loud.any():
+        return audio_data
+
+    # find runs of silent windows, from the changes in the padded loud mask
+    changes = np.diff(np.concatenate(([1], loud.astype(np.int8), [1])))
+    silence_starts = np.flatnonzero(changes == -1)
+    silence_ends = np.flatnonzero(changes == 1)
+
+    margin = int(max_silence_secs / 2 / energy_window_secs)
+    keep = np.ones(len(energies), dtype=bool)
+    for start, end in zip(silence_starts, silence_ends):
+        if start == 0:
+            keep[: max(0, end - margin)] = False
+        elif end == len(energies):
+            keep[start + margin :] = False
+        elif end - start > 2 * margin:
+            keep[start + margin : end - margin] = False
+
+    window_len = max(1, int(audio_data.sample_rate * energy_window_secs))
+    sample_mask = np.repeat(keep, window_len)
+    # a partial last window follows the last full window
+    sample_mask = np.concatenate(
+        (sample_mask, np.full(len(samples) - len(sample_mask), keep[-1]))
+    )
+
+    return sr.AudioData(samples[sample_mask].tobytes(), audio_data.sample_rate, 2)
+
+
+def preprocess(audio_data):
+    """ Compacts a recording before it is sent to a speech to text service:
+    downsamples it to 8kHz 16 bit, and drops silences (recordings include an
+    initial pause and a long final pause).
+    """
+    return trim_silences(downsample(audio_data))
+
+
+def split_at_silences(audio_data, max_segment_secs, overlap_secs):
+    """ Splits audio longer than max_segment_secs into segments of at most
+    max_segment_secs.
+
+    Each cut is placed at the quietest point in the second half of the segment,
+    so that we rarely cut through a word, and consecutive segments overlap by
+    overlap_secs around the cut in case we do.
+
+    Returns a list of AudioData.
+    """
+    duration = get_duration_secs(audio_data)
+    if duration <= max_segment_secs:
+        return [audio_data]
+
+    energies = get_window_energies(get_samples(audio_data), audio_data.sample_rate)
+
+    segments = []
+    start = 0.0
+    while duration - start > max_segment_secs:
+        # look for a cut between the middle and the end of the segment, leaving
+        # room for the overlap
+        search_start = int((start + max_segment_secs / 2) / energy_window_secs)
+        search_end = int(
+            (start + max_segment_secs - overlap_secs / 2) / energy_window_secs
+        )
+        quietest = search_start + int(np.argmin(energies[search_start:search_end]))
+        cut = (quietest + 0.5) * energy_window_secs
+
+        segments.append(get_segment(audio_data, start, cut + overlap_secs / 2))
+        start = cut - overlap_secs / 2
+
+    segments.append(get_segment(audio_data, start, duration))
+    return segments
+
+
+def stitch_transcripts(transcripts, max_overlap_words=10):
+    """ Joins the transcripts of consecutive overlapping segments.
+
+    Words transcribed twice because they fell in the overlap are dropped: we
+    remove the longest prefix of each transcript that repeats the end of the
+    text so far.
+
+    Example:
+    ['your next hearing is', 'hearing is on april third'] ->
+    'your next hearing is on april third'
+    """
+    words = []
+    for transcript in transcripts:
+        new_words = transcript.split()
+
+        max_overlap = min(max_overlap_words, len(words), len(new_words))
+        overlap = 0
+        for n in range(max_overlap, 0, -1):
+            end = [word.lower() for word in words[-n:]]
+            start = [word.lower() for word in new_words[:n]]
+            if end == start:
+                overlap = n
+                break
+
+        words.extend(new_words[overlap:])
+
+    return " ".join(words)
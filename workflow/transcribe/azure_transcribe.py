@@ -1,8 +1,9 @@
-import time
+import threading
 
 import azure.cognitiveservices.speech as speechsdk
+import speech_recognition as sr
 
-from workflow.transcribe import exceptions
+from workflow.transcribe import audio_processing, download, exceptions
 
 
 class AzureTranscriber(object):
@@ -14,66 +15,123 @@ class AzureTranscriber(object):
     https://github.com/Azure-Samples/cognitive-services-speech-sdk/blob/master/samples/python/console/speech_sample.py
     """
 
+    # recordings are downloaded in chunks into a temporary file, which is kept
+    # in memory up to this size and spills to disk above it
+    max_in_memory_audio_bytes = 5 * 1024 * 1024
+    download_chunk_size = 64 * 1024
+
+    # trim silences and downsample before upload, see audio_processing.preprocess
+    preprocess_audio = True
+
+    # audio is pushed to the recognizer in chunks of this size
+    push_chunk_size = 32 * 1024
+
+    # give up on a recognition that hasn't finished after this long
+    recognition_timeout_secs = 600
+
     def __init__(self, azure_speech_key):
         self.speech_config = speechsdk.SpeechConfig(
             subscription=azure_speech_key,
             region="westus",
-            speech_recognition_language="en-US"
+            speech_recognition_language="en-US",
+        )
+
+    def warm_up(self):
+        """ Opens (and closes) a connection to the service, so that the first
+        transcription doesn't pay for the dns lookup and tls handshake.
+        """
+        stream = speechsdk.audio.PushAudioInputStream()
+        recognizer = speechsdk.SpeechRecognizer(
+            speech_config=self.speech_config,
+            audio_config=speechsdk.audio.AudioConfig(stream=stream),
         )
+        connection = speechsdk.Connection.from_recognizer(recognizer)
+        connection.open(True)
+        connection.close()
 
     def transcribe_audio_file_path(self, audio_file_path):
-        # For now supports wav, not mp3
-        # https://stackoverflow.com/questions/51614216/what-audio-formats-are-supported-by-azure-cognitive-services-speech-service-ss?rq=1
-        audio_config = speechsdk.AudioConfig(
-            use_default_microphone=False, filename=audio_file_path
+        """ Transcribe the audio at the given location.
+
+        audio_file_path: may be a filename or a file object
+        """
+        with sr.AudioFile(audio_file_path) as source:
+            audio_object = sr.Recognizer().record(source)
+
+        return self.transcribe_audio_data(audio_object)
+
+    def transcribe_audio_at_uri(self, audio_uri):
+        with download.downloaded_audio(
+            audio_uri, self.max_in_memory_audio_bytes, self.download_chunk_size
+        ) as audio:
+            return self.transcribe_audio_file_path(audio)
+
+    def transcribe_audio_data(self, audio_data):
+        """ Transcribe the given speech_recognition AudioData.
+
+        The samples are pushed to the recognizer from memory, as 16 bit mono pcm.
+        """
+        if self.preprocess_audio:
+            audio_data = audio_processing.preprocess(audio_data)
+
+        stream_format = speechsdk.audio.AudioStreamFormat(
+            samples_per_second=audio_data.sample_rate, bits_per_sample=16, channels=1
         )
+        stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
         speech_recognizer = speechsdk.SpeechRecognizer(
-            speech_config=self.speech_config, audio_config=audio_config
+            speech_config=self.speech_config,
+            audio_config=speechsdk.audio.AudioConfig(stream=stream),
         )
 
-        done = False
-        transcript = ""
+        # open the connection up front, rather than on the first audio chunk
+        connection = speechsdk.Connection.from_recognizer(speech_recognizer)
+        connection.open(True)
+
+        done = threading.Event()
+        transcript = []
         cancellation_details = None
 
-        def stop_cb(evt):
-            """callback that stops continuous recognition upon receiving an event `evt`"""
-            print("CLOSING on {}".format(evt))
-            speech_recognizer.stop_continuous_recognition()
-            nonlocal done
-            done = True
-
-        def return_transcript(evt):
-            """recognition is continuous, that is every sentence gets recognized separately.
-            We want to concatenate all the sentences and return the full transcript"""
-            nonlocal transcript
-            transcript += " "
-            transcript += evt.result.text
-
-        def return_cancellation_details(evt):
-            """return cancellation details"""
+        # recognition is continuous, that is every sentence gets recognized
+        # separately, and we concatenate all of them into the full transcript
+        def on_recognized(evt):
+            transcript.append(evt.result.text)
+
+        def on_canceled(evt):
             nonlocal cancellation_details
-            cancellation_details = evt.result.cancellation_details.error_details
+            details = evt.result.cancellation_details
+            # end of stream is reported as a cancellation, but isn't an error
+            if details.reason == speechsdk.CancellationReason.Error:
+                cancellation_details = details.error_details
+            done.set()
+
+        def on_session_stopped(evt):
+            done.set()
 
         # Connect callbacks to the events fired by the speech recognizer
-        speech_recognizer.recognized.connect(return_transcript)
-        speech_recognizer.canceled.connect(return_cancellation_details)
-        # stop continuous recognition on either session stopped or canceled events
-        speech_recognizer.session_stopped.connect(stop_cb)
-        speech_recognizer.canceled.connect(stop_cb)
+        speech_recognizer.recognized.connect(on_recognized)
+        speech_recognizer.canceled.connect(on_canceled)
+        speech_recognizer.session_stopped.connect(on_session_stopped)
 
-        # Start continuous speech recognition
         speech_recognizer.start_continuous_recognition()
+        try:
+            frame_data = audio_data.get_raw_data(convert_width=2)
+            for i in range(0, len(frame_data), self.push_chunk_size):
+                stream.write(frame_data[i : i + self.push_chunk_size])
+            stream.close()
 
-        while not done:
-            time.sleep(0.5)
+            finished = done.wait(self.recognition_timeout_secs)
+        finally:
+            speech_recognizer.stop_continuous_recognition()
+            connection.close()
 
+        if not finished:
+            raise exceptions.RequestError("Azure Speech recognition timed out")
         if cancellation_details:
             raise exceptions.Canceled(
                 "Azure Speech cancellation error: " + cancellation_details
-                )
-        if transcript == "":
-            raise exceptions.BlankTranscript(
-                "Azure Speech returned blank transcript"
             )
 
+        transcript = " ".join(text for text in transcript if text)
+        if transcript == "":
+            raise exceptions.BlankTranscript("Azure Speech returned blank transcript")
+
         return transcript
@@ -0,0 +1,38 @@
+"""
+Download of call recordings for the transcribers.
+"""
+
+from contextlib import contextmanager
+import tempfile
+
+import requests
+
+from workflow import http_session
+from workflow.transcribe import exceptions
+
+
+@contextmanager
+def downloaded_audio(audio_uri, max_in_memory_bytes, chunk_size):
+    """ Yields a file object, positioned at the start, with the audio at the
+    given uri.
+
+    The audio is streamed in chunks into a temporary file, which is kept in
+    memory up to max_in_memory_bytes and spills to disk above it, so that we
+    never hold more than one chunk of the response in memory.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=max_in_memory_bytes) as audio:
+        try:
+            with http_session.get(audio_uri, stream=True) as response:
+                response.raise_for_status()
+
+                for chunk in response.iter_content(chunk_size):
+                    audio.write(chunk)
+
+        # http://docs.python-requests.org/en/latest/user/quickstart/#errors-and-exceptions
+        except requests.exceptions.RequestException as exc:
+            raise exceptions.RequestError(
+                f"Error retrieving audio from uri: {audio_uri}"
+            ) from exc
+
+        audio.seek(0)
+        yield audio
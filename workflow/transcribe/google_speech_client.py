@@ -0,0 +1,122 @@
+"""
+Client for the Google speech to text REST api, meant to be created once per
+process and shared by all transcriptions (and threads) of that process.
+
+speech_recognition's recognize_google_cloud parses the credentials and builds a
+discovery based speech service for every request, which costs more than the
+recognition itself for short recordings. Here the credentials (and their access
+token, which google.auth refreshes when it expires) and a pooled https session
+are kept for the lifetime of the client.
+
+See https://cloud.google.com/speech-to-text/docs/reference/rest/v1/speech/recognize
+"""
+
+import base64
+import json
+import os
+import threading
+
+from google.auth.exceptions import GoogleAuthError
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2 import service_account
+import requests
+from requests.adapters import HTTPAdapter
+
+from workflow.transcribe import exceptions
+
+
+class GoogleSpeechClient(object):
+
+    recognize_url = "https://speech.googleapis.com/v1/speech:recognize"
+    scopes = ["https://www.googleapis.com/auth/cloud-platform"]
+
+    def __init__(self, google_credentials_json, pool_size=10, timeout_secs=120):
+        self.credentials = service_account.Credentials.from_service_account_info(
+            json.loads(google_credentials_json), scopes=self.scopes
+        )
+        self.timeout_secs = timeout_secs
+
+        self._session = AuthorizedSession(self.credentials)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+
+        # token requests go through a plain session, not the authorized one
+        self._auth_request = Request()
+
+        self._refresh_lock = threading.Lock()
+
+    def warm_up(self):
+        """ Fetches an access token, so that the first recognition doesn't wait
+        for it.
+        """
+        with self._refresh_lock:
+            if not self.credentials.valid:
+                self.credentials.refresh(self._auth_request)
+
+    def recognize(self, audio_data, language, preferred_phrases=None):
+        """ Returns the transcript of the given speech_recognition AudioData.
+
+        Raises exceptions.BadAudio if nothing was recognized, and
+        exceptions.RequestError if the request failed.
+        """
+        # audio samples must be 16 bit, at 8 to 48kHz
+        convert_rate = None
+        if not 8000 <= audio_data.sample_rate <= 48000:
+            convert_rate = max(8000, min(audio_data.sample_rate, 48000))
+        flac_data = audio_data.get_flac_data(
+            convert_rate=convert_rate, convert_width=2
+        )
+
+        config = {
+            "encoding": "FLAC",
+            "sampleRateHertz": convert_rate or audio_data.sample_rate,
+            "languageCode": language,
+        }
+        if preferred_phrases:
+            config["speechContexts"] = [{"phrases": preferred_phrases}]
+
+        body = {
+            "config": config,
+            "audio": {"content": base64.b64encode(flac_data).decode("utf8")},
+        }
+
+        try:
+            # make sure concurrent recognitions don't all refresh the token
+            self.warm_up()
+
+            response = self._session.post(
+                self.recognize_url, json=body, timeout=self.timeout_secs
+            )
+            response.raise_for_status()
+            results = response.json().get("results", [])
+
+        except (requests.exceptions.RequestException, GoogleAuthError) as exc:
+            raise exceptions.RequestError("Speech to text request failed") from exc
+
+        transcript = " ".join(
+            result["alternatives"][0]["transcript"].strip()
+            for result in results
+            if result.get("alternatives")
+        )
+        if not transcript:
+            raise exceptions.BadAudio("Speech to text audio unintelligible")
+
+        return transcript
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(google_credentials_json):
+    """ Returns the client for the given credentials, for the current process.
+
+    Clients are not shared across forks, as their connections would be.
+    """
+    key = (os.getpid(), google_credentials_json)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = GoogleSpeechClient(google_credentials_json)
+            _clients[key] = client
+        return client
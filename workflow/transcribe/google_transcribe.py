@@ -1,18 +1,61 @@
-import io
-
-import requests
+from concurrent.futures import ThreadPoolExecutor
 
 import speech_recognition as sr
 
-from workflow.transcribe import exceptions
+from workflow.cache import hash_key
+from workflow.transcribe import (
+    audio_processing,
+    download,
+    exceptions,
+    google_speech_client,
+)
 
 
 class GoogleTranscriber(object):
-    def __init__(self, google_credentials_json, google_preferred_phrases):
+
+    # recordings are downloaded in chunks into a temporary file, which is kept
+    # in memory up to this size and spills to disk above it
+    max_in_memory_audio_bytes = 5 * 1024 * 1024
+    download_chunk_size = 64 * 1024
+
+    # the synchronous speech to text api only accepts about a minute of audio,
+    # so longer recordings are split into overlapping segments (cut at
+    # silences) which are transcribed concurrently
+    max_segment_secs = 55
+    segment_overlap_secs = 1
+    max_concurrent_segments = 4
+
+    # trim silences and downsample before upload, see audio_processing.preprocess
+    # (speech_recognition encodes the audio to flac for the upload)
+    preprocess_audio = True
+
+    def __init__(
+        self,
+        google_credentials_json,
+        google_preferred_phrases,
+        use_speech_client=False,
+        transcript_cache=None,
+    ):
         self.google_creds = google_credentials_json
         self.language = "en-US"
         self.preferred_phrases = google_preferred_phrases
 
+        # if True, we use a speech client kept for the lifetime of the process
+        # (see google_speech_client) rather than speech_recognition, which sets
+        # up a new client for every request
+        self.use_speech_client = use_speech_client
+
+        # optional workflow.cache.ResultCache of transcripts by audio content,
+        # as identical recordings are common (the same hearing info read back
+        # for several ains, or a retried task)
+        self.transcript_cache = transcript_cache
+
+    def warm_up(self):
+        """ Sets up the speech client ahead of the first transcription.
+        """
+        if self.use_speech_client:
+            google_speech_client.get_client(self.google_creds).warm_up()
+
     def transcribe_audio_file_path(self, audio_file_path):
         """ Transcribe the audio at the given location.
 
@@ -21,42 +64,77 @@ class GoogleTranscriber(object):
         """
 
         with sr.AudioFile(audio_file_path) as source:
-            r = sr.Recognizer()
-            audio_object = r.record(source)
-            try:
-                # hitting this error with SpeechRecognition module if preferred
-                # phrases is not None
-                # https://github.com/Uberi/speech_recognition/issues/334
-                transcript = r.recognize_google_cloud(
-                    audio_data=audio_object,
-                    credentials_json=self.google_creds,
-                    language=self.language,
-                    # preferred_phrases=self.preferred_phrases,
-                    preferred_phrases=None,
-                    show_all=False,
-                )
-
-                return transcript
-
-            except sr.UnknownValueError as exc:
-                raise exceptions.BadAudio(
-                    "Speech to text audio unintelligible"
-                ) from exc
-
-            except sr.RequestError as exc:
-                raise exceptions.RequestError("Speech to text request failed") from exc
+            audio_object = sr.Recognizer().record(source)
 
-    def transcribe_audio_at_uri(self, audio_uri):
+        if self.preprocess_audio:
+            audio_object = audio_processing.preprocess(audio_object)
+
+        if self.transcript_cache is None:
+            return self._transcribe_audio_object(audio_object)
+
+        return self.transcript_cache.get_or_compute(
+            self._transcript_cache_key(audio_object),
+            lambda: self._transcribe_audio_object(audio_object),
+        )
+
+    def _transcript_cache_key(self, audio_data):
+        header = f"{self.language}:{audio_data.sample_rate}:{audio_data.sample_width}:"
+        return hash_key(header.encode("utf8") + audio_data.frame_data)
+
+    def _transcribe_audio_object(self, audio_object):
+        segments = audio_processing.split_at_silences(
+            audio_object, self.max_segment_secs, self.segment_overlap_secs
+        )
+
+        if len(segments) == 1:
+            return self._transcribe_audio_data(segments[0])
+
+        max_workers = min(self.max_concurrent_segments, len(segments))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            transcripts = list(executor.map(self._transcribe_segment, segments))
+
+        if not any(transcripts):
+            raise exceptions.BadAudio("Speech to text audio unintelligible")
+
+        return audio_processing.stitch_transcripts(transcripts)
+
+    def _transcribe_segment(self, audio_data):
+        # a segment may well be only silence, which is fine as long as some
+        # other segment isn't
+        try:
+            return self._transcribe_audio_data(audio_data)
+        except exceptions.BadAudio:
+            return ""
+
+    def _transcribe_audio_data(self, audio_data):
+        if self.use_speech_client:
+            client = google_speech_client.get_client(self.google_creds)
+            return client.recognize(audio_data, self.language, self.preferred_phrases)
+
+        r = sr.Recognizer()
         try:
-            response = requests.get(audio_uri)
-            response.raise_for_status()
+            # hitting this error with SpeechRecognition module if preferred
+            # phrases is not None
+            # https://github.com/Uberi/speech_recognition/issues/334
+            transcript = r.recognize_google_cloud(
+                audio_data=audio_data,
+                credentials_json=self.google_creds,
+                language=self.language,
+                # preferred_phrases=self.preferred_phrases,
+                preferred_phrases=None,
+                show_all=False,
+            )
+
+            return transcript
 
-        # http://docs.python-requests.org/en/latest/user/quickstart/#errors-and-exceptions
-        except requests.exceptions.RequestException as exc:
-            raise exceptions.RequestError(
-                f"Error retrieving audio from uri: {audio_uri}"
-            ) from exc
+        except sr.UnknownValueError as exc:
+            raise exceptions.BadAudio("Speech to text audio unintelligible") from exc
 
-        audio = io.BytesIO(response.content)
+        except sr.RequestError as exc:
+            raise exceptions.RequestError("Speech to text request failed") from exc
 
-        return self.transcribe_audio_file_path(audio)
+    def transcribe_audio_at_uri(self, audio_uri):
+        with download.downloaded_audio(
+            audio_uri, self.max_in_memory_audio_bytes, self.download_chunk_size
+        ) as audio:
+            return self.transcribe_audio_file_path(audio)
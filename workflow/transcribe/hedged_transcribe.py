@@ -0,0 +1,175 @@
+"""
+Transcriber that sends the same audio to several speech to text providers,
+to cut the latency of the slow responses a single provider sometimes has.
+
+The primary provider is started first, and each next provider is only started
+if no transcript arrived within hedge_delay_secs of the previous one (or right
+away if all the running ones failed). The first transcript wins. Set the delay
+to about the p95 latency of the primary, see latency_stats.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import io
+import threading
+import time
+
+from workflow.transcribe import download, exceptions
+
+
+class LatencyHistogram(object):
+    """ Thread-safe histogram of latencies, in seconds.
+    """
+
+    default_bounds_secs = (1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300)
+
+    def __init__(self, bounds_secs=default_bounds_secs):
+        self.bounds_secs = list(bounds_secs)
+        # the last bucket counts latencies above the last bound
+        self.counts = [0] * (len(self.bounds_secs) + 1)
+        self.count = 0
+        self.total_secs = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, secs):
+        with self._lock:
+            i = 0
+            while i < len(self.bounds_secs) and secs > self.bounds_secs[i]:
+                i += 1
+            self.counts[i] += 1
+            self.count += 1
+            self.total_secs += secs
+
+    def percentile(self, p):
+        """ Returns the upper bound of the bucket holding the p-th percentile
+        (float("inf") if above all bounds), or None if nothing was observed.
+        """
+        with self._lock:
+            if self.count == 0:
+                return None
+
+            rank = p / 100 * self.count
+            seen = 0
+            for bound, count in zip(self.bounds_secs, self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return float("inf")
+
+    def stats(self):
+        with self._lock:
+            count = self.count
+            mean = self.total_secs / count if count else None
+        return {
+            "count": count,
+            "mean": mean,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+        }
+
+
+class HedgedTranscriber(object):
+
+    # recordings are downloaded in chunks into a temporary file, which is kept
+    # in memory up to this size and spills to disk above it
+    max_in_memory_audio_bytes = 5 * 1024 * 1024
+    download_chunk_size = 64 * 1024
+
+    def __init__(self, providers, hedge_delay_secs):
+        """
+        providers: list of (name, transcriber) pairs, primary first
+        """
+        self.providers = list(providers)
+        self.hedge_delay_secs = hedge_delay_secs
+
+        # latency of the successful transcriptions of each provider, including
+        # those finishing after another provider won
+        self.latencies = {name: LatencyHistogram() for name, _ in self.providers}
+
+    def warm_up(self):
+        for _, transcriber in self.providers:
+            transcriber.warm_up()
+
+    def latency_stats(self):
+        return {name: latencies.stats() for name, latencies in self.latencies.items()}
+
+    def transcribe_audio_file_path(self, audio_file_path):
+        """ Transcribe the audio at the given location.
+
+        audio_file_path: may be a filename or a file object
+        """
+        if isinstance(audio_file_path, str):
+            return self._transcribe(
+                lambda transcriber: transcriber.transcribe_audio_file_path(
+                    audio_file_path
+                )
+            )
+
+        # each provider reads the audio from its own file object
+        audio = audio_file_path.read()
+        return self._transcribe(
+            lambda transcriber: transcriber.transcribe_audio_file_path(
+                io.BytesIO(audio)
+            )
+        )
+
+    def transcribe_audio_at_uri(self, audio_uri):
+        # the recording is downloaded once for all providers
+        with download.downloaded_audio(
+            audio_uri, self.max_in_memory_audio_bytes, self.download_chunk_size
+        ) as audio:
+            return self.transcribe_audio_file_path(audio)
+
+    def _timed(self, name, transcriber, transcribe):
+        start = time.monotonic()
+        transcript = transcribe(transcriber)
+        if not transcript:
+            raise exceptions.BlankTranscript(f"{name} returned blank transcript")
+
+        self.latencies[name].observe(time.monotonic() - start)
+        return transcript
+
+    def _transcribe(self, transcribe):
+        """ Returns the first transcript returned by transcribe(transcriber) for
+        the providers, started as described at the top of this module.
+
+        If all providers fail, raises the error of the first one.
+        """
+        executor = ThreadPoolExecutor(max_workers=len(self.providers))
+        pending = {}
+        errors = [None] * len(self.providers)
+        next_provider = 0
+        hedge_at = None
+
+        try:
+            while True:
+                now = time.monotonic()
+                if next_provider < len(self.providers) and (
+                    not pending or now >= hedge_at
+                ):
+                    name, transcriber = self.providers[next_provider]
+                    future = executor.submit(self._timed, name, transcriber, transcribe)
+                    pending[future] = next_provider
+                    next_provider += 1
+                    hedge_at = now + self.hedge_delay_secs
+
+                if not pending:
+                    raise next(error for error in errors if error is not None)
+
+                timeout = None
+                if next_provider < len(self.providers):
+                    timeout = max(0, hedge_at - time.monotonic())
+
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider = pending.pop(future)
+                    try:
+                        return future.result()
+                    except Exception as exc:
+                        errors[provider] = exc
+
+        finally:
+            # the losers can't be interrupted once started: we stop waiting
+            # for them and drop their transcripts
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)